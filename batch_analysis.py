@@ -0,0 +1,338 @@
+# _*_ coding: utf-8 _*_
+# Author: GC Zhu
+# Email: zhugc2016@gmail.com
+
+"""
+Batch analysis of recorded sessions.
+
+Every recording written by `TCCIDesktopET.save_data` is turned into one per-participant
+summary row (data loss, precision, fixation count and, when available, the calibration
+fitting error). Files are spread across a process pool, read in fixed-size chunks and
+the per-file results are cached by content hash, so that re-running the analysis after
+adding a session only processes the new recording.
+
+Usage:
+    python batch_analysis.py data/ -o summary.csv -j 8
+"""
+
+import argparse
+import ast
+import csv
+import hashlib
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+
+# Bump whenever the metrics below change, so stale cache entries are ignored.
+ANALYSIS_VERSION = 2
+
+SUMMARY_FIELDS = ['participant', 'path', 'n_samples', 'data_loss', 'precision_rms_s2s',
+                  'fixation_count', 'fitting_error']
+
+_COLUMNS = ['timestamp', 'status', 'gaze_x', 'gaze_y']
+
+
+class NotARecordingError(ValueError):
+    """Raised for csv files without the recording columns, e.g. a `PreviewRecorder` frame index."""
+
+
+class AnalysisParams:
+    def __init__(self, chunk_size=50000, velocity_threshold=1000.0, min_fixation_duration=0.1,
+                 timestamp_scale=1e-3, calibration_suffix='.calibration'):
+        """
+        :param chunk_size: number of samples read from disk at once
+        :param velocity_threshold: I-VT threshold in pixels per second
+        :param min_fixation_duration: minimum fixation duration in seconds
+        :param timestamp_scale: seconds per native timestamp tick
+        :param calibration_suffix: suffix of the sidecar file holding `str(CalibrationResult)`
+        """
+        self.chunk_size = chunk_size
+        self.velocity_threshold = velocity_threshold
+        self.min_fixation_duration = min_fixation_duration
+        self.timestamp_scale = timestamp_scale
+        self.calibration_suffix = calibration_suffix
+
+    def key(self):
+        return json.dumps({
+            'version': ANALYSIS_VERSION,
+            'velocity_threshold': self.velocity_threshold,
+            'min_fixation_duration': self.min_fixation_duration,
+            'timestamp_scale': self.timestamp_scale,
+        }, sort_keys=True)
+
+
+def file_digest(path, block_size=1 << 20):
+    """Returns the sha256 hex digest of the file content."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def iter_chunks(path, chunk_size):
+    """
+    Streams a recording as (timestamp, status, gaze_x, gaze_y) float64 arrays of at most
+    `chunk_size` rows, so memory does not grow with the recording length.
+    """
+    with open(path, 'r', newline='') as f:
+        reader = csv.reader(f)
+        header = [h.strip() for h in next(reader)]
+        try:
+            indices = [header.index(c) for c in _COLUMNS]
+        except ValueError:
+            raise NotARecordingError(f"{path} must contain the columns {_COLUMNS}, got {header}")
+
+        while True:
+            rows = list(itertools.islice(reader, chunk_size))
+            if not rows:
+                return
+            chunk = np.array([[row[i] for i in indices] for row in rows if row], dtype=np.float64)
+            if chunk.size:
+                yield chunk[:, 0], chunk[:, 1], chunk[:, 2], chunk[:, 3]
+
+
+def read_fitting_error(path, suffix):
+    """Reads the calibration fitting error from the sidecar file, -1 if absent."""
+    sidecar = Path(path).with_suffix(suffix)
+    if not sidecar.exists():
+        return -1
+    result = ast.literal_eval(sidecar.read_text(encoding='utf-8').strip())
+    return float(result.get('fitting_error', -1))
+
+
+class _SessionAccumulator:
+    """Running metrics that are carried across chunk boundaries."""
+
+    def __init__(self, params: AnalysisParams):
+        self.params = params
+        self.n_samples = 0
+        self.n_valid = 0
+        self.s2s_sq_sum = 0.0
+        self.s2s_count = 0
+        self.fixation_count = 0
+        # state of the previous sample and of the current fixation candidate
+        self._last = None
+        self._fixation_start = None
+        self._fixation_end = None
+
+    def update(self, timestamp, status, gaze_x, gaze_y):
+        params = self.params
+        self.n_samples += len(status)
+        valid = status == 1
+        self.n_valid += int(np.count_nonzero(valid))
+
+        # prepend the last sample of the previous chunk to get continuous differences
+        if self._last is not None:
+            timestamp = np.concatenate(([self._last[0]], timestamp))
+            valid = np.concatenate(([self._last[1]], valid))
+            gaze_x = np.concatenate(([self._last[2]], gaze_x))
+            gaze_y = np.concatenate(([self._last[3]], gaze_y))
+        self._last = (timestamp[-1], valid[-1], gaze_x[-1], gaze_y[-1])
+        if len(timestamp) < 2:
+            return
+
+        pair_valid = valid[1:] & valid[:-1]
+        distance = np.hypot(np.diff(gaze_x), np.diff(gaze_y))
+
+        dt = np.diff(timestamp) * params.timestamp_scale
+        with np.errstate(divide='ignore', invalid='ignore'):
+            velocity = np.where(dt > 0, distance / dt, np.inf)
+        slow = pair_valid & (velocity < params.velocity_threshold)
+
+        # precision is only meaningful within fixations, saccades would dominate it otherwise
+        self.s2s_sq_sum += float(np.sum(distance[slow] ** 2))
+        self.s2s_count += int(np.count_nonzero(slow))
+
+        # I-VT: runs of consecutive slow sample pairs form fixation candidates
+        edges = np.diff(np.concatenate(([0], slow.astype(np.int8), [0])))
+        run_starts = np.flatnonzero(edges == 1)
+        run_ends = np.flatnonzero(edges == -1)
+        if len(run_starts) == 0 or run_starts[0] != 0:
+            self._close_fixation()
+        for run_start, run_end in zip(run_starts, run_ends):
+            if self._fixation_start is None:
+                self._fixation_start = timestamp[run_start]
+            self._fixation_end = timestamp[run_end]
+            if run_end != len(slow):
+                self._close_fixation()
+
+    def _close_fixation(self):
+        if self._fixation_start is not None:
+            duration = (self._fixation_end - self._fixation_start) * self.params.timestamp_scale
+            if duration >= self.params.min_fixation_duration:
+                self.fixation_count += 1
+        self._fixation_start = None
+        self._fixation_end = None
+
+    def summary(self):
+        self._close_fixation()
+        return {
+            'n_samples': self.n_samples,
+            'data_loss': 1 - self.n_valid / self.n_samples if self.n_samples else 1.0,
+            'precision_rms_s2s': float(np.sqrt(self.s2s_sq_sum / self.s2s_count)) if self.s2s_count else -1,
+            'fixation_count': self.fixation_count,
+        }
+
+
+def analyze_file(path, params: AnalysisParams):
+    """
+    Analyzes a single recording.
+
+    :param path: path of the recording
+    :param params: analysis parameters
+    :return: summary dict with the keys in `SUMMARY_FIELDS`
+    """
+    accumulator = _SessionAccumulator(params)
+    for chunk in iter_chunks(path, params.chunk_size):
+        accumulator.update(*chunk)
+
+    summary = {'participant': Path(path).stem, 'path': str(path)}
+    summary.update(accumulator.summary())
+    summary['fitting_error'] = read_fitting_error(path, params.calibration_suffix)
+    return summary
+
+
+class ResultCache:
+    """On-disk cache of per-file summaries keyed by content hash and analysis version."""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _entry(self, digest, params: AnalysisParams):
+        key = hashlib.sha256((digest + params.key()).encode('utf-8')).hexdigest()
+        return self.cache_dir / f'{key}.json'
+
+    def get(self, digest, params: AnalysisParams):
+        entry = self._entry(digest, params)
+        if not entry.exists():
+            return None
+        with open(entry, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def put(self, digest, params: AnalysisParams, summary):
+        entry = self._entry(digest, params)
+        tmp = entry.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(summary, f)
+        os.replace(tmp, entry)
+
+
+def _content_digest(path, params: AnalysisParams):
+    # the calibration sidecar is part of the summary, so it is part of the key too
+    digest = file_digest(path)
+    sidecar = Path(path).with_suffix(params.calibration_suffix)
+    if sidecar.exists():
+        digest += file_digest(sidecar)
+    return digest
+
+
+def _analyze_task(path, digest, params: AnalysisParams):
+    return path, digest, analyze_file(path, params)
+
+
+def run_batch(paths, params: AnalysisParams, cache_dir=None, workers=None, verbose=True):
+    """
+    Analyzes all recordings, reusing cached summaries when the file content is unchanged.
+
+    Files that are not recordings (see `NotARecordingError`) or that fail to parse are
+    reported and left out, so one bad file does not abort the whole batch.
+
+    :param paths: recording paths
+    :param params: analysis parameters
+    :param cache_dir: cache directory, None to disable caching
+    :param workers: number of worker processes, defaults to the CPU count
+    :param verbose: print progress and throughput
+    :return: list of summary dicts of the analyzed recordings, in the order of `paths`
+    """
+    paths = [str(p) for p in paths]
+    cache = ResultCache(cache_dir) if cache_dir is not None else None
+    results = {}
+    pending = []
+    for path in paths:
+        digest = _content_digest(path, params) if cache is not None else None
+        cached = cache.get(digest, params) if cache is not None else None
+        if cached is not None:
+            # path-derived fields are not part of the content key
+            cached['participant'] = Path(path).stem
+            cached['path'] = path
+            results[path] = cached
+        else:
+            pending.append((path, digest))
+
+    if verbose:
+        print(f"{len(paths)} recordings, {len(results)} cached, {len(pending)} to analyze")
+
+    start = time.perf_counter()
+    total_bytes = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_analyze_task, path, digest, params): path for path, digest in pending}
+        for done, future in enumerate(as_completed(futures), start=1):
+            try:
+                path, digest, summary = future.result()
+            except NotARecordingError:
+                print(f"[{done}/{len(pending)}] {futures[future]}: skipped, not a recording")
+                continue
+            except Exception as e:
+                print(f"[{done}/{len(pending)}] {futures[future]}: failed, {type(e).__name__}: {e}")
+                continue
+            results[path] = summary
+            if cache is not None:
+                cache.put(digest, params, summary)
+            total_bytes += os.path.getsize(path)
+            if verbose:
+                elapsed = time.perf_counter() - start
+                print(f"[{done}/{len(pending)}] {Path(path).name}: "
+                      f"{done / elapsed:.2f} files/s, {total_bytes / elapsed / 1e6:.2f} MB/s")
+
+    return [results[path] for path in paths if path in results]
+
+
+def write_summary(summaries, output_path):
+    with open(output_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        for summary in summaries:
+            writer.writerow({k: summary[k] for k in SUMMARY_FIELDS})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize recorded eye tracking sessions.")
+    parser.add_argument('inputs', nargs='+', help="recording files or directories")
+    parser.add_argument('-o', '--output', default='summary.csv', help="summary csv path")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="number of worker processes")
+    parser.add_argument('--pattern', default='*.csv', help="glob pattern used inside directories")
+    parser.add_argument('--cache-dir', default='.analysis_cache', help="result cache directory")
+    parser.add_argument('--no-cache', action='store_true', help="disable the result cache")
+    parser.add_argument('--chunk-size', type=int, default=50000)
+    parser.add_argument('--velocity-threshold', type=float, default=1000.0, help="pixels per second")
+    parser.add_argument('--min-fixation-duration', type=float, default=0.1, help="seconds")
+    parser.add_argument('--timestamp-scale', type=float, default=1e-3, help="seconds per timestamp tick")
+    args = parser.parse_args(argv)
+
+    paths = []
+    for item in args.inputs:
+        item = Path(item)
+        paths.extend(sorted(item.rglob(args.pattern)) if item.is_dir() else [item])
+    # never analyze a summary written by a previous run
+    output = Path(args.output).resolve()
+    paths = [p for p in paths if p.resolve() != output]
+
+    params = AnalysisParams(chunk_size=args.chunk_size,
+                            velocity_threshold=args.velocity_threshold,
+                            min_fixation_duration=args.min_fixation_duration,
+                            timestamp_scale=args.timestamp_scale)
+    summaries = run_batch(paths, params, cache_dir=None if args.no_cache else args.cache_dir,
+                          workers=args.workers)
+    write_summary(summaries, args.output)
+    print(f"Summary of {len(summaries)} recordings written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+# _*_ coding: utf-8 _*_
+# Author: GC Zhu
+# Email: zhugc2016@gmail.com
+
+import time
+
+import numpy as np
+
+from core import GazeInfo, TCCIDesktopET
+
+
+class ClockAligner:
+    """
+    Maps native `GazeInfo.timestamp` values to the host clock (`time.perf_counter()`).
+
+    The mapping host = offset + drift * native is estimated by online linear regression
+    over (native, host) pairs. Sums are accumulated relative to the first pair, so that
+    large uint64 native timestamps do not lose precision, and an optional forgetting
+    factor lets the estimate follow slow changes of the drift.
+    """
+
+    def __init__(self, forgetting=1.0):
+        """
+        :param forgetting: weight of past pairs per update, 1.0 keeps all pairs equally weighted
+        """
+        self.forgetting = forgetting
+        self._native_origin = None
+        self._host_origin = None
+        self._count = 0  # pairs added, `_n` is their forgetting-weighted sum
+        self._n = 0.0
+        self._sx = 0.0
+        self._sy = 0.0
+        self._sxx = 0.0
+        self._sxy = 0.0
+        self._slope = 0.0
+        self._intercept = 0.0
+        self._last_native = None
+
+    @property
+    def count(self):
+        """Number of timestamp pairs used so far."""
+        return self._count
+
+    def update(self, native_timestamp, host_timestamp):
+        """
+        Adds one (native, host) timestamp pair and updates the estimate.
+
+        :param native_timestamp: native timestamp of a gaze sample
+        :param host_timestamp: host time at which the sample was received
+        """
+        if self._native_origin is None:
+            self._native_origin = int(native_timestamp)
+            self._host_origin = float(host_timestamp)
+        x = float(int(native_timestamp) - self._native_origin)
+        y = float(host_timestamp) - self._host_origin
+
+        f = self.forgetting
+        self._count += 1
+        self._n = f * self._n + 1
+        self._sx = f * self._sx + x
+        self._sy = f * self._sy + y
+        self._sxx = f * self._sxx + x * x
+        self._sxy = f * self._sxy + x * y
+
+        denominator = self._n * self._sxx - self._sx * self._sx
+        if denominator > 0:
+            self._slope = (self._n * self._sxy - self._sx * self._sy) / denominator
+        self._intercept = (self._sy - self._slope * self._sx) / self._n
+
+    def sample(self, et_library: TCCIDesktopET) -> GazeInfo:
+        """
+        Reads one gaze sample and uses it as an alignment pair.
+
+        The host time is the midpoint of the native call, which halves the call latency error.
+        Invalid samples and repeats of the previous sample (polling faster than the tracker)
+        are returned but not used for the fit.
+
+        :param et_library: sampling eye tracker
+        :return: the GazeInfo that was read
+        """
+        before = time.perf_counter()
+        gaze_info = et_library.get_gaze_info()
+        after = time.perf_counter()
+        if gaze_info.status == 1 and gaze_info.timestamp != self._last_native:
+            self._last_native = gaze_info.timestamp
+            self.update(gaze_info.timestamp, (before + after) / 2)
+        return gaze_info
+
+    @property
+    def drift(self):
+        """Host seconds per native tick."""
+        return self._slope
+
+    @property
+    def offset(self):
+        """Host time of native timestamp 0."""
+        return self._host_origin + self._intercept - self._slope * self._native_origin
+
+    def to_host(self, native_timestamps):
+        """
+        Converts native timestamps to host time.
+
+        :param native_timestamps: scalar or array of native timestamps (uint64 is fine)
+        :return: float64 host timestamps
+        """
+        if self._count < 2:
+            raise ValueError("At least two timestamp pairs are required before converting.")
+        native = np.asarray(native_timestamps)
+        relative = (native.astype(np.int64) - np.int64(self._native_origin)).astype(np.float64)
+        return self._host_origin + self._intercept + self._slope * relative
+
+    def to_native(self, host_timestamps):
+        """
+        Converts host timestamps to (fractional) native timestamps.
+
+        :param host_timestamps: scalar or array of host timestamps
+        :return: float64 native timestamps relative to zero
+        """
+        if self._count < 2 or self._slope == 0:
+            raise ValueError("At least two timestamp pairs are required before converting.")
+        host = np.asarray(host_timestamps, dtype=np.float64)
+        return self._native_origin + (host - self._host_origin - self._intercept) / self._slope
+
+    def __str__(self):
+        return str({
+            'count': self._count,
+            'offset': self.offset if self._native_origin is not None else None,
+            'drift': self._slope
+        })
+
+
+def resample(timestamps, gaze_x, gaze_y, status, rate, max_gap=0.1, openness=None, blink_threshold=0.1,
+             start=None, stop=None):
+    """
+    Resamples a gaze stream to a fixed rate by linear interpolation.
+
+    Samples with `status != 1` or, when `openness` is given, with openness below
+    `blink_threshold` are not used. Output samples that fall into a gap longer than
+    `max_gap` between two usable samples are marked invalid and set to NaN.
+
+    :param timestamps: sample times in seconds (e.g. `ClockAligner.to_host` output), ascending
+    :param gaze_x: gaze x coordinates
+    :param gaze_y: gaze y coordinates
+    :param status: sample status
+    :param rate: output rate in Hz
+    :param max_gap: longest gap in seconds that is bridged by interpolation
+    :param openness: optional eye openness, e.g. min(left_openness, right_openness)
+    :param blink_threshold: openness below which a sample is treated as a blink
+    :param start: first output time, defaults to the first sample time
+    :param stop: last output time (exclusive), defaults to just after the last sample time
+    :return: (times, x, y, valid) arrays
+    """
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    if len(timestamps) == 0 and (start is None or stop is None):
+        empty = np.empty(0, dtype=np.float64)
+        return empty, empty.copy(), empty.copy(), np.empty(0, dtype=bool)
+    usable = np.asarray(status) == 1
+    if openness is not None:
+        usable &= np.asarray(openness) >= blink_threshold
+    t = timestamps[usable]
+    x = np.asarray(gaze_x, dtype=np.float64)[usable]
+    y = np.asarray(gaze_y, dtype=np.float64)[usable]
+
+    start = timestamps[0] if start is None else start
+    stop = timestamps[-1] + 1.0 / rate / 2 if stop is None else stop
+    times = start + np.arange(int(np.ceil((stop - start) * rate))) / rate
+    if len(t) == 0:
+        nan = np.full(len(times), np.nan)
+        return times, nan, nan.copy(), np.zeros(len(times), dtype=bool)
+
+    right = np.searchsorted(t, times, side='left')
+    left = right - 1
+    exact = (right < len(t)) & (t[np.minimum(right, len(t) - 1)] == times)
+    inside = (left >= 0) & (right < len(t))
+    gap = np.where(inside, t[np.minimum(right, len(t) - 1)] - t[np.maximum(left, 0)], np.inf)
+    valid = exact | (inside & (gap <= max_gap))
+
+    out_x = np.where(valid, np.interp(times, t, x), np.nan)
+    out_y = np.where(valid, np.interp(times, t, y), np.nan)
+    return times, out_x, out_y, valid
+
+
+def match_events(event_times, sample_times, tolerance=None):
+    """
+    Finds the nearest sample for every event with a single `searchsorted`.
+
+    :param event_times: event times on the same clock as `sample_times`
+    :param sample_times: ascending sample times
+    :param tolerance: maximum time difference, events further away get index -1
+    :return: int64 array of sample indices, one per event
+    """
+    event_times = np.asarray(event_times, dtype=np.float64)
+    sample_times = np.asarray(sample_times, dtype=np.float64)
+    if len(sample_times) == 0:
+        return np.full(len(event_times), -1, dtype=np.int64)
+
+    right = np.clip(np.searchsorted(sample_times, event_times), 1, len(sample_times) - 1)
+    left = right - 1
+    if len(sample_times) == 1:
+        right = left = np.zeros_like(right)
+    use_right = np.abs(sample_times[right] - event_times) < np.abs(event_times - sample_times[left])
+    indices = np.where(use_right, right, left).astype(np.int64)
+    if tolerance is not None:
+        indices[np.abs(sample_times[indices] - event_times) > tolerance] = -1
+    return indices
@@ -9,6 +9,8 @@ import platform
 
 import numpy as np
 
+from screen_geometry import ScreenGeometry
+
 
 class CalibrationResult:
     def __init__(self, status=0, fitting_error=0, sample_size=0):
@@ -102,6 +104,7 @@ class TCCIDesktopET:
         //             dpi_x, dpi_y - screen dpi
         """
         self.native_lib.set_camera_screen_info.argtypes = [ctypes.c_float, ctypes.c_float,
+                                                           ctypes.c_float, ctypes.c_float,
                                                            ctypes.c_float, ctypes.c_float]
         self.native_lib.set_camera_screen_info.restype = ctypes.c_int
         # Starts the eye-tracking calibration process
@@ -164,8 +167,16 @@ class TCCIDesktopET:
         self.image_height = 480
         # Image ndarray
         self.image = np.zeros((self.image_height, self.image_width, 3), dtype=np.uint8)
-        # Screen size
-        self.screen_width, self.screen_height = 1920, 1080
+        # Screen geometry, replaced by `set_cam_screen_info`
+        self.screen_geometry = ScreenGeometry()
+
+    @property
+    def screen_width(self):
+        return self.screen_geometry.screen_width
+
+    @property
+    def screen_height(self):
+        return self.screen_geometry.screen_height
 
     def set_tracing_region(self, x: int, y: int, width: int, height: int):
         self.native_lib.set_tracing_region(x, y, width, height)
@@ -178,9 +189,20 @@ class TCCIDesktopET:
 
     def set_cam_screen_info(self, camera_position=(17.09, -0.65), screen_size=(1920, 1080),
                             screen_size_inch=(34.4 / 2.54, 19.4 / 2.54)):
-        cam_pos_x, cam_pos_y = camera_position
-        screen_width, screen_height = screen_size
-        dpi_x, dpi_y = screen_width / screen_size_inch[0], screen_height / screen_size_inch[1]
+        """
+        Sets camera and screen info and updates `screen_geometry` accordingly.
+
+        :param camera_position: camera position in centimeters relative to the top-left screen corner
+        :param screen_size: screen resolution in pixels
+        :param screen_size_inch: physical screen size in inches
+        """
+        self.screen_geometry = ScreenGeometry(camera_position=camera_position,
+                                              screen_size=screen_size,
+                                              screen_size_cm=(screen_size_inch[0] * 2.54,
+                                                              screen_size_inch[1] * 2.54))
+        cam_pos_x, cam_pos_y = self.screen_geometry.camera_position
+        screen_width, screen_height = self.screen_geometry.screen_size
+        dpi_x, dpi_y = self.screen_geometry.dpi
         self.native_lib.set_camera_screen_info(cam_pos_x, cam_pos_y, screen_width, screen_height, dpi_x, dpi_y)
 
     def eye_tracking_register(self, license_key: str) -> int:
@@ -205,7 +227,7 @@ class TCCIDesktopET:
 
     def set_camera_screen_info(self, x_cm, y_cm, screen_width_px, screen_height_px, dpi_x, dpi_y):
         """
-        Sets camera and screen info
+        Sets camera and screen info, and updates `screen_geometry` to match.
         Parameters:
             x_cm, y_cm - camera position in centimeters (float or int)
             screen_width_px, screen_height_px - screen size in pixels (int)
@@ -224,6 +246,10 @@ class TCCIDesktopET:
         if not (isinstance(dpi_x, (int, float)) and isinstance(dpi_y, (int, float))):
             raise TypeError("dpi_x and dpi_y should be of type int or float.")
 
+        self.screen_geometry = ScreenGeometry(camera_position=(x_cm, y_cm),
+                                              screen_size=(screen_width_px, screen_height_px),
+                                              screen_size_cm=(screen_width_px / dpi_x * 2.54,
+                                                              screen_height_px / dpi_y * 2.54))
         return self.native_lib.set_camera_screen_info(x_cm, y_cm, screen_width_px, screen_height_px, dpi_x, dpi_y)
 
     def start_calibration(self):
@@ -366,7 +392,7 @@ class TCCIDesktopET:
 
         return GazeInfo(
             status=status.value,
-            timestamp=timestamp,
+            timestamp=timestamp.value,
             gaze_x=x.value,
             gaze_y=y.value,
             left_openness=left_openness.value,
@@ -0,0 +1,169 @@
+# _*_ coding: utf-8 _*_
+# Author: GC Zhu
+# Email: zhugc2016@gmail.com
+
+import json
+
+import numpy as np
+
+from core import GazeInfo
+
+# number of polynomial terms of each model, the first term is always the constant offset
+_MODEL_TERMS = {
+    'affine': 3,  # 1, x, y
+    'poly2': 6,  # 1, x, y, x*y, x^2, y^2
+}
+
+
+def _design_matrix(x, y, model):
+    """Builds the feature matrix for normalized coordinates."""
+    if model == 'affine':
+        return np.stack([np.ones_like(x), x, y], axis=-1)
+    return np.stack([np.ones_like(x), x, y, x * y, x * x, y * y], axis=-1)
+
+
+class DriftCorrection:
+    """
+    A lightweight correction layer applied on top of `TCCIDesktopET.get_gaze_info` output.
+
+    The correction is fitted from a short one- to five-point check by regularized least
+    squares on the gaze error (target - measured). The constant offset is never penalized,
+    so a single point yields a pure offset correction and more points progressively enable
+    the affine or polynomial terms, without needing a full `start_calibration` run.
+    """
+
+    def __init__(self, model='affine', screen_size=(1920, 1080), regularization=1e-2):
+        """
+        :param model: 'affine' or 'poly2'
+        :param screen_size: screen size in pixels, used to normalize coordinates
+        :param regularization: ridge weight of the non-constant terms
+        """
+        if model not in _MODEL_TERMS:
+            raise ValueError(f"Invalid correction model: {model}, you need to choose from {list(_MODEL_TERMS)}.")
+        self.model = model
+        self.screen_size = tuple(screen_size)
+        self.regularization = regularization
+        # (n_terms, 2) coefficients of the x and y error, identity correction by default
+        self.coefficients = np.zeros((_MODEL_TERMS[model], 2), dtype=np.float64)
+        self.residual_error = -1
+
+    def fit(self, targets, measured):
+        """
+        Fits the correction from validation samples.
+
+        :param targets: (n, 2) validation point positions in pixels
+        :param measured: (n, 2) gaze positions in pixels measured while looking at the targets
+        :return: self
+        """
+        targets = np.asarray(targets, dtype=np.float64).reshape(-1, 2)
+        measured = np.asarray(measured, dtype=np.float64).reshape(-1, 2)
+        if len(targets) == 0 or len(targets) != len(measured):
+            raise ValueError("targets and measured must be non-empty and of the same length.")
+
+        scale = np.asarray(self.screen_size, dtype=np.float64)
+        norm = measured / scale
+        features = _design_matrix(norm[:, 0], norm[:, 1], self.model)
+        error = (targets - measured) / scale
+
+        # ridge rows keep the fit well-posed with fewer points than terms
+        n_terms = features.shape[1]
+        penalty = np.sqrt(self.regularization) * np.eye(n_terms)[1:]
+        a = np.vstack([features, penalty])
+        b = np.vstack([error, np.zeros((n_terms - 1, 2))])
+        self.coefficients = np.linalg.lstsq(a, b, rcond=None)[0]
+
+        corrected = self.apply_batch(measured[:, 0], measured[:, 1])
+        self.residual_error = float(np.mean(np.hypot(*(np.stack(corrected, axis=-1) - targets).T)))
+        return self
+
+    def apply(self, gaze_info: GazeInfo) -> GazeInfo:
+        """
+        Corrects a single gaze sample.
+
+        :param gaze_info: sample returned by `get_gaze_info`
+        :return: a new GazeInfo with corrected gaze coordinates
+        """
+        x, y = self.apply_point(gaze_info.gaze_x, gaze_info.gaze_y)
+        return GazeInfo(status=gaze_info.status,
+                        timestamp=gaze_info.timestamp,
+                        gaze_x=x,
+                        gaze_y=y,
+                        left_openness=gaze_info.left_openness,
+                        right_openness=gaze_info.right_openness)
+
+    def apply_point(self, x, y):
+        """Corrects one gaze position in pixels, using plain floats to avoid array overhead."""
+        width, height = self.screen_size
+        nx, ny = x / width, y / height
+        c = self.coefficients
+        dx = c[0, 0] + c[1, 0] * nx + c[2, 0] * ny
+        dy = c[0, 1] + c[1, 1] * nx + c[2, 1] * ny
+        if self.model == 'poly2':
+            nxy, nxx, nyy = nx * ny, nx * nx, ny * ny
+            dx += c[3, 0] * nxy + c[4, 0] * nxx + c[5, 0] * nyy
+            dy += c[3, 1] * nxy + c[4, 1] * nxx + c[5, 1] * nyy
+        return float(x + dx * width), float(y + dy * height)
+
+    def apply_batch(self, gaze_x, gaze_y):
+        """
+        Corrects recorded gaze arrays.
+
+        :param gaze_x: array of x coordinates in pixels
+        :param gaze_y: array of y coordinates in pixels
+        :return: (corrected_x, corrected_y) arrays
+        """
+        gaze_x = np.asarray(gaze_x, dtype=np.float64)
+        gaze_y = np.asarray(gaze_y, dtype=np.float64)
+        width, height = self.screen_size
+        error = _design_matrix(gaze_x / width, gaze_y / height, self.model) @ self.coefficients
+        return gaze_x + error[..., 0] * width, gaze_y + error[..., 1] * height
+
+    def to_dict(self):
+        return {
+            'model': self.model,
+            'screen_size': list(self.screen_size),
+            'regularization': self.regularization,
+            'coefficients': self.coefficients.tolist(),
+            'residual_error': self.residual_error,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        correction = cls(model=data['model'], screen_size=data['screen_size'],
+                         regularization=data['regularization'])
+        correction.coefficients = np.asarray(data['coefficients'], dtype=np.float64)
+        correction.residual_error = data.get('residual_error', -1)
+        return correction
+
+    def __str__(self):
+        return str(self.to_dict())
+
+
+def export_corrected_calibration(cali_info: str, correction: DriftCorrection) -> str:
+    """
+    Bundles the string from `TCCIDesktopET.export_calibration` with a drift correction.
+
+    :param cali_info: calibration string
+    :param correction: fitted drift correction
+    :return: json string that can be written next to (or instead of) the calibration file
+    """
+    return json.dumps({'calibration': cali_info, 'drift_correction': correction.to_dict()})
+
+
+def load_corrected_calibration(text: str):
+    """
+    Parses a bundle written by `export_corrected_calibration`.
+
+    A plain calibration string (without correction) is also accepted.
+
+    :param text: bundle or calibration string
+    :return: (calibration string, DriftCorrection or None)
+    """
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return text, None
+    if not isinstance(data, dict) or 'calibration' not in data:
+        return text, None
+    correction = data.get('drift_correction')
+    return data['calibration'], DriftCorrection.from_dict(correction) if correction else None
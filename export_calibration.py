@@ -24,7 +24,7 @@ else:
 # initialize PyGame
 pygame.init()
 # scree size
-screen_size = (1920, 1080)
+screen_size = (et_library.screen_width, et_library.screen_height)
 # open a window in fullscreen mode
 screen = pygame.display.set_mode(screen_size, FULLSCREEN | HWSURFACE)
 
@@ -0,0 +1,366 @@
+# _*_ coding: utf-8 _*_
+# Author: GC Zhu
+# Email: zhugc2016@gmail.com
+
+"""
+Face-quality feedback for the previewer, using the MediaPipe models bundled in `mediapipe/modules`.
+
+Requires a TFLite interpreter: `tflite-runtime`, `ai-edge-litert` or `tensorflow`.
+"""
+
+import logging
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+_MODULE_DIR = Path(__file__).parent.absolute() / 'mediapipe/modules'
+FACE_DETECTION_MODEL = _MODULE_DIR / 'face_detection/face_detection_short_range.tflite'
+FACE_LANDMARK_MODEL = _MODULE_DIR / 'face_landmark/face_landmark.tflite'
+
+_DETECTION_SIZE = 128
+_LANDMARK_SIZE = 192
+
+# face mesh indices: (outer corner, inner corner, upper lid, lower lid)
+_LEFT_EYE = (33, 133, 159, 145)
+_RIGHT_EYE = (263, 362, 386, 374)
+
+_INFERENCE_LOCK = threading.Lock()
+
+
+class FaceQuality:
+    def __init__(self, status=0, face_box=(0, 0, 0, 0), head_distance=-1, left_openness=0.0, right_openness=0.0,
+                 timestamp=0.0):
+        """
+        :param status: 1 if a face was found, 0 otherwise
+        :param face_box: (x, y, width, height) in image pixels
+        :param head_distance: estimated camera-to-face distance in centimeters, -1 if unknown
+        :param left_openness: eye aspect ratio of the left eye (image left)
+        :param right_openness: eye aspect ratio of the right eye (image right)
+        :param timestamp: `time.perf_counter()` of the processed frame
+        """
+        self.status = status
+        self.face_box = face_box
+        self.head_distance = head_distance
+        self.left_openness = left_openness
+        self.right_openness = right_openness
+        self.timestamp = timestamp
+
+    def __str__(self):
+        return str({
+            'status': self.status,
+            'face_box': self.face_box,
+            'head_distance': self.head_distance,
+            'left_openness': self.left_openness,
+            'right_openness': self.right_openness,
+            'timestamp': self.timestamp
+        })
+
+
+def _import_interpreter():
+    """Imports the TFLite interpreter on first use, so importing this module stays cheap."""
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            try:
+                from tensorflow.lite import Interpreter
+            except ImportError:
+                raise ImportError("FaceQualityPipeline needs a TFLite interpreter, "
+                                  "please install tflite-runtime, ai-edge-litert or tensorflow.")
+    return Interpreter
+
+
+@lru_cache(maxsize=None)
+def _load_interpreter(model_path, num_threads):
+    """Loads a TFLite model once per process; later pipelines reuse the same interpreter."""
+    Interpreter = _import_interpreter()
+    interpreter = Interpreter(model_path=str(model_path), num_threads=num_threads)
+    interpreter.allocate_tensors()
+    return interpreter
+
+
+@lru_cache(maxsize=None)
+def _detection_anchors():
+    """SSD anchors of the short-range face detector (896 anchors, normalized centers)."""
+    anchors = []
+    for stride, per_cell in ((8, 2), (16, 6)):
+        size = _DETECTION_SIZE // stride
+        ys, xs = np.meshgrid(np.arange(size), np.arange(size), indexing='ij')
+        centers = np.stack([(xs.ravel() + 0.5) / size, (ys.ravel() + 0.5) / size], axis=-1)
+        anchors.append(np.repeat(centers, per_cell, axis=0))
+    return np.concatenate(anchors).astype(np.float32)
+
+
+class FaceQualityPipeline:
+    """
+    Reports face box, head distance and eye openness for `get_previewer_image` frames.
+
+    The face detector only runs every `detect_interval` frames (or when tracking is lost);
+    in between, the landmark model is run on a square ROI around the previous face,
+    downscaled to the 192x192 model input. `process` never runs inference on the caller's
+    thread: it copies the frame into a preallocated buffer, hands it to a worker thread if
+    the worker is idle (otherwise the frame is skipped) and returns the latest result, so
+    the preview loop only pays for one frame copy.
+    """
+
+    def __init__(self, detect_interval=10, focal_length=554.0, eye_distance_cm=6.3,
+                 roi_scale=1.5, score_threshold=0.5, num_threads=2):
+        """
+        :param detect_interval: run the face detector every n processed frames
+        :param focal_length: camera focal length in pixels, used for the head distance
+        :param eye_distance_cm: assumed distance between the eye centers in centimeters
+        :param roi_scale: ROI side relative to the face size
+        :param score_threshold: minimum detection and face presence score
+        :param num_threads: TFLite interpreter threads
+        """
+        self.detect_interval = detect_interval
+        self.focal_length = focal_length
+        self.eye_distance_cm = eye_distance_cm
+        self.roi_scale = roi_scale
+        self.score_threshold = score_threshold
+
+        self._detector = _load_interpreter(FACE_DETECTION_MODEL, num_threads)
+        self._landmarker = _load_interpreter(FACE_LANDMARK_MODEL, num_threads)
+        self._anchors = _detection_anchors()
+
+        self._frame_index = 0
+        self._roi = None  # (center_x, center_y, side) of the tracked face
+        self.last_result = FaceQuality()
+        self.skipped_frames = 0
+
+        # worker thread state, `_busy` is True while the worker owns `_buffer`
+        self._buffer = None
+        self._busy = False
+        self._closed = False
+        self._condition = threading.Condition()
+        self._worker = None
+
+    def reset(self):
+        """Forgets the tracked face; waits for a running inference to finish."""
+        with self._condition:
+            while self._busy:
+                self._condition.wait()
+            self._frame_index = 0
+            self._roi = None
+            self.last_result = FaceQuality()
+            self.skipped_frames = 0
+
+    def process(self, image: np.ndarray) -> FaceQuality:
+        """
+        Submits one RGB frame to the worker thread without waiting for it.
+
+        :param image: (height, width, 3) uint8 RGB frame, e.g. from `get_previewer_image`
+        :return: the latest available FaceQuality
+        """
+        with self._condition:
+            if self._busy:
+                self.skipped_frames += 1
+                return self.last_result
+            if self._buffer is None or self._buffer.shape != image.shape:
+                self._buffer = np.empty_like(image)
+            np.copyto(self._buffer, image)
+            self._busy = True
+            if self._worker is None:
+                self._closed = False
+                self._worker = threading.Thread(target=self._work_loop, name='FaceQualityPipeline', daemon=True)
+                self._worker.start()
+            self._condition.notify_all()
+            return self.last_result
+
+    def process_frame(self, image: np.ndarray) -> FaceQuality:
+        """
+        Processes one RGB frame on the calling thread, e.g. for offline sequential processing.
+
+        Do not mix with `process` on the same pipeline, they share the tracking state.
+
+        :param image: (height, width, 3) uint8 RGB frame
+        :return: the FaceQuality of this frame
+        """
+        start = time.perf_counter()
+        if self._roi is None or self._frame_index % self.detect_interval == 0:
+            self._roi = self._detect(image)
+        result = FaceQuality(timestamp=start)
+        if self._roi is not None:
+            landmarks, presence = self._landmarks([image], [self._roi])
+            if presence[0] >= self.score_threshold:
+                result = self._measure(landmarks[0], start)
+                self._roi = self._roi_from_landmarks(landmarks[0])
+            else:
+                self._roi = None
+        self._frame_index += 1
+        self.last_result = result
+        return result
+
+    def close(self):
+        """Stops the worker thread, a later `process` starts a new one."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
+
+    def _work_loop(self):
+        while True:
+            with self._condition:
+                while not self._busy and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    # a frame submitted right before `close` is dropped
+                    self._busy = False
+                    self._condition.notify_all()
+                    return
+            # the caller does not touch `_buffer` or the tracking state while `_busy` is set
+            result = None
+            try:
+                result = self.process_frame(self._buffer)
+            except Exception:
+                logging.exception("Face quality processing failed.")
+            finally:
+                with self._condition:
+                    if result is not None:
+                        self.last_result = result
+                    self._busy = False
+                    self._condition.notify_all()
+
+    def process_batch(self, images, batch_size=32):
+        """
+        Processes recorded frames in batches.
+
+        The detector runs on every `detect_interval`-th frame and the landmark model
+        runs batched on all frames, using the ROI of the preceding detection. No frame
+        budget is applied.
+
+        :param images: sequence of (height, width, 3) uint8 RGB frames
+        :param batch_size: number of frames per inference call
+        :return: list of FaceQuality, one per frame
+        """
+        images = list(images)
+        key_indices = list(range(0, len(images), self.detect_interval))
+        key_rois = []
+        for i in range(0, len(key_indices), batch_size):
+            key_rois.extend(self._detect_batch([images[k] for k in key_indices[i:i + batch_size]]))
+
+        rois = [key_rois[i // self.detect_interval] for i in range(len(images))]
+        tracked = [i for i, roi in enumerate(rois) if roi is not None]
+        results = [FaceQuality() for _ in images]
+        for i in range(0, len(tracked), batch_size):
+            indices = tracked[i:i + batch_size]
+            landmarks, presence = self._landmarks([images[k] for k in indices], [rois[k] for k in indices])
+            for k, points, score in zip(indices, landmarks, presence):
+                if score >= self.score_threshold:
+                    results[k] = self._measure(points)
+        return results
+
+    @staticmethod
+    def _run(interpreter, batch):
+        """Runs an interpreter on a batch, resizing the input tensor only when the batch size changes."""
+        # interpreters are shared by all pipelines and are not thread-safe
+        with _INFERENCE_LOCK:
+            input_detail = interpreter.get_input_details()[0]
+            if input_detail['shape'][0] != len(batch):
+                interpreter.resize_tensor_input(input_detail['index'], [len(batch)] + list(batch.shape[1:]))
+                interpreter.allocate_tensors()
+            interpreter.set_tensor(input_detail['index'], batch)
+            interpreter.invoke()
+            return [interpreter.get_tensor(d['index']) for d in interpreter.get_output_details()]
+
+    def _detect(self, image):
+        return self._detect_batch([image])[0]
+
+    def _detect_batch(self, images):
+        """Runs the face detector on letterboxed, downscaled frames and returns one ROI per frame."""
+        height, width = images[0].shape[:2]
+        scale = _DETECTION_SIZE / max(width, height)
+        new_w, new_h = int(round(width * scale)), int(round(height * scale))
+        pad_x, pad_y = (_DETECTION_SIZE - new_w) // 2, (_DETECTION_SIZE - new_h) // 2
+
+        batch = np.zeros((len(images), _DETECTION_SIZE, _DETECTION_SIZE, 3), dtype=np.float32)
+        for i, image in enumerate(images):
+            small = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_AREA)
+            batch[i, pad_y:pad_y + new_h, pad_x:pad_x + new_w] = small
+        batch = batch / 127.5 - 1.0
+
+        # the detector graph has a fixed batch of one, so only the preprocessing is batched
+        boxes, scores = [], []
+        for i in range(len(images)):
+            outputs = self._run(self._detector, batch[i:i + 1])
+            boxes.append(next(o for o in outputs if o.shape[-1] == 16)[0])
+            scores.append(next(o for o in outputs if o.shape[-1] == 1)[0, :, 0])
+
+        rois = []
+        for box, score in zip(boxes, scores):
+            best = int(np.argmax(score))
+            if 1 / (1 + np.exp(-np.clip(score[best], -100, 100))) < self.score_threshold:
+                rois.append(None)
+                continue
+            cx, cy = box[best, :2] / _DETECTION_SIZE + self._anchors[best]
+            w, h = box[best, 2:4] / _DETECTION_SIZE
+            # back from the letterboxed detector input to image pixels
+            cx = (cx * _DETECTION_SIZE - pad_x) / scale
+            cy = (cy * _DETECTION_SIZE - pad_y) / scale
+            side = max(w, h) * _DETECTION_SIZE / scale * self.roi_scale
+            rois.append((float(cx), float(cy), float(side)))
+        return rois
+
+    def _landmarks(self, images, rois):
+        """Runs the landmark model on the ROIs and returns landmarks in image pixels and presence scores."""
+        batch = np.empty((len(images), _LANDMARK_SIZE, _LANDMARK_SIZE, 3), dtype=np.float32)
+        for i, (image, (cx, cy, side)) in enumerate(zip(images, rois)):
+            ratio = _LANDMARK_SIZE / side
+            matrix = np.array([[ratio, 0, _LANDMARK_SIZE / 2 - cx * ratio],
+                               [0, ratio, _LANDMARK_SIZE / 2 - cy * ratio]], dtype=np.float32)
+            batch[i] = cv2.warpAffine(image, matrix, (_LANDMARK_SIZE, _LANDMARK_SIZE),
+                                      flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+        batch /= 255.0
+
+        outputs = self._run(self._landmarker, batch)
+        mesh = next(o for o in outputs if o.shape[-1] == 1404).reshape(len(images), -1, 3)[..., :2]
+        flag = next(o for o in outputs if o.shape[-1] == 1).reshape(len(images))
+
+        sides = np.array([roi[2] for roi in rois], dtype=np.float32)[:, None, None]
+        origins = np.array([(roi[0] - roi[2] / 2, roi[1] - roi[2] / 2) for roi in rois], dtype=np.float32)[:, None]
+        landmarks = origins + mesh * sides / _LANDMARK_SIZE
+        presence = 1 / (1 + np.exp(-flag))
+        return landmarks, presence
+
+    def _roi_from_landmarks(self, landmarks):
+        x_min, y_min = landmarks.min(axis=0)
+        x_max, y_max = landmarks.max(axis=0)
+        side = max(x_max - x_min, y_max - y_min) * self.roi_scale
+        return float((x_min + x_max) / 2), float((y_min + y_max) / 2), float(side)
+
+    def _measure(self, landmarks, timestamp=0.0):
+        x_min, y_min = landmarks.min(axis=0)
+        x_max, y_max = landmarks.max(axis=0)
+
+        def openness(eye):
+            outer, inner, upper, lower = landmarks[list(eye)]
+            return float(np.linalg.norm(upper - lower) / max(np.linalg.norm(outer - inner), 1e-6))
+
+        left_center = landmarks[list(_LEFT_EYE[:2])].mean(axis=0)
+        right_center = landmarks[list(_RIGHT_EYE[:2])].mean(axis=0)
+        eye_distance_px = float(np.linalg.norm(left_center - right_center))
+        head_distance = self.focal_length * self.eye_distance_cm / eye_distance_px if eye_distance_px > 0 else -1
+
+        return FaceQuality(status=1,
+                           face_box=(float(x_min), float(y_min), float(x_max - x_min), float(y_max - y_min)),
+                           head_distance=head_distance,
+                           left_openness=openness(_LEFT_EYE),
+                           right_openness=openness(_RIGHT_EYE),
+                           timestamp=timestamp)
+
+
+def create_pipeline(**kwargs):
+    """Creates a FaceQualityPipeline, or returns None (with a warning) if no TFLite interpreter is installed."""
+    try:
+        return FaceQualityPipeline(**kwargs)
+    except ImportError as e:
+        logging.warning(str(e))
+        return None
@@ -0,0 +1,351 @@
+# _*_ coding: utf-8 _*_
+# Author: GC Zhu
+# Email: zhugc2016@gmail.com
+
+import math
+import time
+from collections import deque
+
+import numpy as np
+
+from core import GazeInfo
+
+
+class PredictionStats:
+    def __init__(self, count=0, prediction_error=0.0, baseline_error=0.0, effective_latency=None,
+                 baseline_latency=None):
+        """
+        :param count: number of evaluated predictions
+        :param prediction_error: mean distance in pixels between predicted and actual gaze
+        :param baseline_error: mean distance in pixels between the latest sample and actual gaze
+        :param effective_latency: seconds by which the predicted cursor lags the gaze (`replay` only)
+        :param baseline_latency: seconds by which the latest-sample cursor lags the gaze (`replay` only)
+        """
+        self.count = count
+        self.prediction_error = prediction_error
+        self.baseline_error = baseline_error
+        self.effective_latency = effective_latency
+        self.baseline_latency = baseline_latency
+
+    def __str__(self):
+        return str({
+            'count': self.count,
+            'prediction_error': self.prediction_error,
+            'baseline_error': self.baseline_error,
+            'effective_latency': self.effective_latency,
+            'baseline_latency': self.baseline_latency
+        })
+
+
+class GazePredictor:
+    """
+    Extrapolates gaze to the presentation time of the next `pygame.display.flip`.
+
+    The velocity and acceleration are estimated from the last three valid samples and
+    optionally smoothed exponentially. Below `saccade_velocity` the eye is considered
+    fixating and the latest sample is returned unchanged, so fixational noise is not
+    amplified; above it, the position is extrapolated with a constant-acceleration model,
+    limited to `max_horizon` seconds and to the point where a decelerating eye comes to
+    rest. Every prediction is compared with the gaze that is actually measured at its
+    target time: the error statistics are reported by `get_stats` and the fraction of the
+    extrapolation that is applied is adapted online. The extrapolation keeps being scored
+    while it is switched off, and `gain` stays 0 until it has reduced the error of the
+    latest sample by a clear margin over the recent predictions, so prediction is not worse
+    than no prediction when the sampling rate or the noise do not allow it to help.
+
+    Example:
+        predictor = GazePredictor()
+        while running:
+            predictor.update(et_library.get_gaze_info())
+            x, y = predictor.predict_next_frame()
+            ...
+            pygame.display.flip()
+            predictor.frame_presented()
+    """
+
+    def __init__(self, saccade_velocity=2000.0, max_horizon=0.05, display_latency=0.0, smoothing=1.0,
+                 gain_rate=0.05, gate_rate=0.05, screen_size=None):
+        """
+        :param saccade_velocity: speed in pixels per second above which gaze is extrapolated
+        :param max_horizon: longest extrapolation in seconds
+        :param display_latency: extra seconds between the flip and the light leaving the screen
+        :param smoothing: weight of the newest velocity/acceleration estimate (0-1]
+        :param gain_rate: adaptation rate of the extrapolation gain, 0 keeps the full extrapolation
+        :param gate_rate: forgetting rate of the error statistics that switch the extrapolation on and off
+        :param screen_size: (width, height) in pixels predictions are clamped to, None to not clamp;
+            `Graphics.draw_sampling` sets it to the screen it draws on
+        """
+        self.saccade_velocity = saccade_velocity
+        self.max_horizon = max_horizon
+        self.display_latency = display_latency
+        self.smoothing = smoothing
+        self.gain_rate = gain_rate
+        self.gate_rate = gate_rate
+        self.screen_size = tuple(screen_size) if screen_size is not None else None
+
+        self._last_native_timestamp = None
+        self._samples = deque(maxlen=3)  # (time, x, y) of the latest valid samples
+        self._velocity = (0.0, 0.0)
+        self._acceleration = (0.0, 0.0)
+        self._last_flip = None
+        self._frame_interval = None
+        # (target_time, predicted_x, predicted_y, baseline_x, baseline_y, extrapolation_x, extrapolation_y,
+        #  candidate_x, candidate_y), the candidate being the prediction with the gate open; bounded, so
+        # predictions made while tracking is lost do not pile up, the oldest ones are stale anyway
+        self._pending = deque(maxlen=64)
+        self.gain = 0.0  # fraction of the extrapolation that is applied, 0 while the gate is closed
+        self._gain_raw = 1.0
+        # exponentially weighted count, sum and sum of squares of how much the extrapolation
+        # reduced the error compared to the latest sample, for the gate
+        self._gate_weight = 0.0
+        self._gate_sum = 0.0
+        self._gate_square_sum = 0.0
+        self._extrapolating = False
+        self._count = 0
+        self._prediction_error_sum = 0.0
+        self._baseline_error_sum = 0.0
+
+    def update(self, gaze_info: GazeInfo, timestamp: float = None):
+        """
+        Adds a gaze sample.
+
+        :param gaze_info: sample returned by `get_gaze_info`
+        :param timestamp: host time of the sample, defaults to `time.perf_counter()`;
+            pass `ClockAligner.to_host(gaze_info.timestamp)` for better precision
+        """
+        if gaze_info.status != 1:
+            return
+        # polling faster than the tracker returns the same sample again
+        if gaze_info.timestamp and gaze_info.timestamp == self._last_native_timestamp:
+            return
+        self._last_native_timestamp = gaze_info.timestamp
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        if self._samples and timestamp <= self._samples[-1][0]:
+            return
+        x, y = float(gaze_info.gaze_x), float(gaze_info.gaze_y)
+        if self._samples:
+            self._evaluate(self._samples[-1], (timestamp, x, y))
+        self._samples.append((timestamp, x, y))
+        if len(self._samples) < 2:
+            return
+
+        (t0, x0, y0), (t1, x1, y1) = self._samples[-2], self._samples[-1]
+        velocity = ((x1 - x0) / (t1 - t0), (y1 - y0) / (t1 - t0))
+        acceleration = (0.0, 0.0)
+        if len(self._samples) == 3:
+            previous = self._samples[0]
+            previous_velocity = ((x0 - previous[1]) / (t0 - previous[0]), (y0 - previous[2]) / (t0 - previous[0]))
+            half_span = (t1 - previous[0]) / 2
+            acceleration = ((velocity[0] - previous_velocity[0]) / half_span,
+                            (velocity[1] - previous_velocity[1]) / half_span)
+
+        w = self.smoothing
+        self._velocity = (w * velocity[0] + (1 - w) * self._velocity[0],
+                          w * velocity[1] + (1 - w) * self._velocity[1])
+        self._acceleration = (w * acceleration[0] + (1 - w) * self._acceleration[0],
+                              w * acceleration[1] + (1 - w) * self._acceleration[1])
+
+    def frame_presented(self, timestamp: float = None):
+        """
+        Marks a `pygame.display.flip`, used to estimate the time of the next one.
+
+        :param timestamp: host time of the flip, defaults to `time.perf_counter()`
+        """
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        if self._last_flip is not None:
+            interval = timestamp - self._last_flip
+            self._frame_interval = interval if self._frame_interval is None else \
+                0.9 * self._frame_interval + 0.1 * interval
+        self._last_flip = timestamp
+
+    def next_presentation_time(self, now: float = None):
+        """Expected host time at which the frame being composed becomes visible."""
+        if now is None:
+            now = time.perf_counter()
+        if self._last_flip is None or self._frame_interval is None:
+            return now + self.display_latency
+        presentation = self._last_flip + self._frame_interval
+        if presentation < now:
+            # a frame was missed, skip ahead to the next vsync after now
+            presentation += math.ceil((now - presentation) / self._frame_interval) * self._frame_interval
+        return presentation + self.display_latency
+
+    def predict(self, target_time: float):
+        """
+        Predicts the gaze position at a host time.
+
+        :param target_time: host time in seconds
+        :return: (x, y) in pixels, or None if no valid sample was seen yet
+        """
+        if not self._samples:
+            return None
+        t, x, y = self._samples[-1]
+        baseline_x, baseline_y = x, y
+        extrapolation_x = extrapolation_y = 0.0
+        vx, vy = self._velocity
+        if math.hypot(vx, vy) >= self.saccade_velocity:
+            dt = min(max(target_time - t, 0.0), self.max_horizon)
+            ax, ay = self._acceleration
+            braking = ax * vx + ay * vy
+            if braking < 0:
+                # decelerating: do not extrapolate past the point where the eye comes to rest
+                dt = min(dt, (vx * vx + vy * vy) / -braking)
+            extrapolation_x = vx * dt + 0.5 * ax * dt * dt
+            extrapolation_y = vy * dt + 0.5 * ay * dt * dt
+            if not self._extrapolating:
+                # the gate is only switched when a movement starts: within a saccade the extrapolation
+                # helps early and overshoots late, so switching it per frame would lag behind
+                self.gain = self._open_gain() if self._gate_open() else 0.0
+            self._extrapolating = True
+        else:
+            self._extrapolating = False
+        candidate_x, candidate_y = self._extrapolate(x, y, extrapolation_x, extrapolation_y, self._open_gain())
+        x, y = self._extrapolate(x, y, extrapolation_x, extrapolation_y, self.gain)
+
+        self._pending.append((target_time, x, y, baseline_x, baseline_y, extrapolation_x, extrapolation_y,
+                              candidate_x, candidate_y))
+        return x, y
+
+    def _extrapolate(self, x, y, extrapolation_x, extrapolation_y, gain):
+        if extrapolation_x == 0 and extrapolation_y == 0:
+            return x, y
+        if self.screen_size is None:
+            return x + gain * extrapolation_x, y + gain * extrapolation_y
+        return (min(max(x + gain * extrapolation_x, 0.0), self.screen_size[0]),
+                min(max(y + gain * extrapolation_y, 0.0), self.screen_size[1]))
+
+    def _open_gain(self):
+        return min(max(self._gain_raw, 0.0), 1.0)
+
+    def _gate_open(self, z=2.0):
+        """Whether the extrapolation reduced the error, by `z` standard errors, in the recent predictions."""
+        if self._gate_weight < 2:
+            return False
+        mean = self._gate_sum / self._gate_weight
+        variance = max(self._gate_square_sum / self._gate_weight - mean * mean, 0.0)
+        return mean - z * math.sqrt(variance / self._gate_weight) > 0
+
+    def predict_next_frame(self, now: float = None):
+        """Predicts the gaze position at `next_presentation_time`."""
+        return self.predict(self.next_presentation_time(now))
+
+    def _evaluate(self, previous, current):
+        """Scores the pending predictions whose target time lies between two samples."""
+        t0, x0, y0 = previous
+        t1, x1, y1 = current
+        while self._pending and self._pending[0][0] <= t1:
+            target_time, px, py, bx, by, ex, ey, cx, cy = self._pending.popleft()
+            if target_time < t0:
+                continue
+            ratio = (target_time - t0) / (t1 - t0)
+            actual_x, actual_y = x0 + ratio * (x1 - x0), y0 + ratio * (y1 - y0)
+            self._count += 1
+            self._prediction_error_sum += math.hypot(px - actual_x, py - actual_y)
+            self._baseline_error_sum += math.hypot(bx - actual_x, by - actual_y)
+
+            norm = ex * ex + ey * ey
+            if norm == 0:
+                continue
+            # least-squares gain of this extrapolation: (actual - baseline) projected on it
+            best_gain = ((actual_x - bx) * ex + (actual_y - by) * ey) / norm
+            self._gain_raw = (1 - self.gain_rate) * self._gain_raw + self.gain_rate * best_gain
+
+            # the gate scores the extrapolation as if it had been applied, so it can reopen
+            improvement = math.hypot(bx - actual_x, by - actual_y) - math.hypot(cx - actual_x, cy - actual_y)
+            keep = 1 - self.gate_rate
+            self._gate_weight = keep * self._gate_weight + 1
+            self._gate_sum = keep * self._gate_sum + improvement
+            self._gate_square_sum = keep * self._gate_square_sum + improvement * improvement
+
+    def get_stats(self) -> PredictionStats:
+        if not self._count:
+            return PredictionStats()
+        return PredictionStats(count=self._count,
+                               prediction_error=self._prediction_error_sum / self._count,
+                               baseline_error=self._baseline_error_sum / self._count)
+
+    def reset(self):
+        self.__init__(saccade_velocity=self.saccade_velocity, max_horizon=self.max_horizon,
+                      display_latency=self.display_latency, smoothing=self.smoothing,
+                      gain_rate=self.gain_rate, gate_rate=self.gate_rate, screen_size=self.screen_size)
+
+
+def replay(timestamps, gaze_x, gaze_y, status, frame_interval=1 / 60, latency=1 / 60, predictor=None):
+    """
+    Replays a recording through a predictor as if it drove a display.
+
+    A frame is composed every `frame_interval` seconds using the samples available at that
+    time and becomes visible `latency` seconds later. The effective latency of a cursor is
+    the delay of the recorded gaze that best matches it (least squares over all frames),
+    i.e. how far behind the eye the cursor appears on screen.
+
+    :param timestamps: host sample times in seconds, ascending
+    :param gaze_x: gaze x coordinates
+    :param gaze_y: gaze y coordinates
+    :param status: sample status
+    :param frame_interval: display refresh interval in seconds
+    :param latency: delay between composing a frame and its presentation in seconds
+    :param predictor: predictor to evaluate, defaults to `GazePredictor()`
+    :return: PredictionStats comparing the predicted and the latest-sample cursor
+    """
+    predictor = GazePredictor() if predictor is None else predictor
+    predictor.display_latency = 0.0
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    frame_times = np.arange(timestamps[0] + frame_interval, timestamps[-1], frame_interval)
+    # index of the first sample that is not yet available at each frame
+    available = np.searchsorted(timestamps, frame_times, side='right')
+
+    presented = []  # (presentation_time, predicted_x, predicted_y, baseline_x, baseline_y)
+    next_sample = 0
+    for frame_time, end in zip(frame_times, available):
+        for i in range(next_sample, end):
+            predictor.update(GazeInfo(status=status[i], gaze_x=gaze_x[i], gaze_y=gaze_y[i]), timestamps[i])
+        next_sample = end
+        prediction = predictor.predict(frame_time + latency)
+        if prediction is not None:
+            presented.append((frame_time + latency, *prediction, *predictor._samples[-1][1:]))
+        predictor.frame_presented(frame_time)
+    for i in range(next_sample, len(timestamps)):
+        predictor.update(GazeInfo(status=status[i], gaze_x=gaze_x[i], gaze_y=gaze_y[i]), timestamps[i])
+
+    stats = predictor.get_stats()
+    valid = np.asarray(status) == 1
+    if presented and np.count_nonzero(valid) > 1:
+        presented = np.asarray(presented)
+        t, x, y = timestamps[valid], np.asarray(gaze_x, dtype=np.float64)[valid], \
+            np.asarray(gaze_y, dtype=np.float64)[valid]
+        stats.effective_latency = _effective_latency(presented[:, 0], presented[:, 1], presented[:, 2], t, x, y,
+                                                     latency + 2 * frame_interval)
+        stats.baseline_latency = _effective_latency(presented[:, 0], presented[:, 3], presented[:, 4], t, x, y,
+                                                    latency + 2 * frame_interval)
+    return stats
+
+
+def _effective_latency(times, cursor_x, cursor_y, sample_times, gaze_x, gaze_y, max_latency, step=1e-3):
+    """Delay of the gaze signal, searched in [-max_latency, max_latency], that best matches the cursor."""
+    delays = np.arange(-max_latency, max_latency + step / 2, step)
+    lagged = times[None, :] - delays[:, None]
+    squared_error = (np.interp(lagged, sample_times, gaze_x) - cursor_x) ** 2 + \
+        (np.interp(lagged, sample_times, gaze_y) - cursor_y) ** 2
+    return round(float(delays[np.argmin(squared_error.mean(axis=1))]), 6)
+
+
+# Example usage: replay synthetic recordings of fixations and saccades at 60 and 120 Hz.
+if __name__ == "__main__":
+    rng = np.random.default_rng(2024)
+    targets = rng.uniform((100, 100), (1820, 980), size=(41, 2))
+    for sampling_rate in (60, 120):
+        sample_times = np.arange(0, 20, 1 / sampling_rate)
+        positions = np.empty((len(sample_times), 2))
+        for k, sample_time in enumerate(sample_times):
+            index, phase = divmod(sample_time, 0.5)
+            index = int(index)
+            # 50 ms minimum-jerk saccade at the start of every 500 ms fixation
+            s = min(phase / 0.05, 1.0)
+            s = 10 * s ** 3 - 15 * s ** 4 + 6 * s ** 5
+            positions[k] = targets[index] + s * (targets[index + 1] - targets[index])
+        positions += rng.normal(0, 3, positions.shape)
+        stats = replay(sample_times, positions[:, 0], positions[:, 1], np.ones(len(sample_times), dtype=int))
+        print(f"{sampling_rate} Hz: {stats}")
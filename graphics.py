@@ -3,25 +3,44 @@
 # Email: zhugc2016@gmail.com
 
 import math
+import time
 from pathlib import Path
-from typing import Tuple
+from typing import TYPE_CHECKING, Tuple
 
 import cv2
 import numpy as np
 # import pandas as pd
 import pygame
 
+from clock_alignment import ClockAligner
 from core import CalibrationPoint, CalibrationResult, TCCIDesktopET, GazeInfo
+from drift_correction import DriftCorrection
+from gaze_prediction import GazePredictor
+from preview_recorder import PreviewRecorder
+from screen_geometry import ScreenGeometry
+
+if TYPE_CHECKING:
+    # only needed for annotations, the face-quality models are optional
+    from face_quality import FaceQuality, FaceQualityPipeline
 
 
 # from misc import GazeInfo
 
 
+class _SilentSound:
+    """Stands in for the feedback sound when the audio device is disabled."""
+
+    def play(self, *args, **kwargs):
+        pass
+
+
 class Graphics:
-    def __init__(self, et_library: TCCIDesktopET):
+    def __init__(self, et_library: TCCIDesktopET, headless: bool = False):
         """
 
         :param et_library:
+        :param headless: render without audio and with the bundled pygame font, for offscreen
+            screens created by `headless.init_headless`
         """
         # color constant
         self._color_white = (255, 255, 255)
@@ -37,29 +56,58 @@ class Graphics:
         self.error_bar_color = (0, 255, 0)  # Green color for the error bar
         self.error_bar_thickness = 2  # Thickness of the error bar lin
 
-        # initialize the font
-        self.guidance_font = pygame.font.SysFont('Microsoft YaHei', 20, bold=True)
+        self.headless = headless
+        # called with the screen after every flip, e.g. to capture frames in headless mode
+        self.frame_callback = None
+
+        # initialize the font, the bundled font keeps headless frames identical across machines
+        if headless:
+            pygame.font.init()
+            self.guidance_font = pygame.font.Font(None, 26)
+        else:
+            self.guidance_font = pygame.font.SysFont('Microsoft YaHei', 20, bold=True)
 
         # initialize the mixer and load sound
-        pygame.mixer.init()
-        _audio_path = Path(__file__).parent.absolute() / 'res/audio/beep.wav'
-        self.feedback_sound = pygame.mixer.Sound(_audio_path)  # Replace with the path to your sound file
+        if headless:
+            self.feedback_sound = _SilentSound()
+        else:
+            pygame.mixer.init()
+            _audio_path = Path(__file__).parent.absolute() / 'res/audio/beep.wav'
+            self.feedback_sound = pygame.mixer.Sound(_audio_path)  # Replace with the path to your sound file
 
-        self._new_session()
+        # arrow images
+        _arrow_path = Path(__file__).parent.absolute() / 'res/image/left_arrow.png'
+        self.left_arrow_image = pygame.image.load(_arrow_path)
+        self.right_arrow_image = pygame.transform.flip(self.left_arrow_image, True, False)
 
-        self.screen_height = et_library.screen_height
-        self.screen_width = et_library.screen_width
+        self._new_session()
 
         self.image_width = self.et_library.image_width
         self.image_height = self.et_library.image_height
         self.pygame_previewer_size = (self.image_width, self.image_height)
-        self.previewer_center = (self.screen_width / 2 - self.image_width / 2,
-                                 self.screen_height / 2 - self.image_height / 2)
         self.previewer_surface = pygame.Surface(self.pygame_previewer_size)
         # Image size
         self.running = False
         self._last_drawing_point: CalibrationPoint = CalibrationPoint(0, 0)
 
+    @property
+    def screen_geometry(self) -> ScreenGeometry:
+        # read through et_library, `set_cam_screen_info` replaces the geometry object
+        return self.et_library.screen_geometry
+
+    @property
+    def screen_width(self):
+        return self.screen_geometry.screen_width
+
+    @property
+    def screen_height(self):
+        return self.screen_geometry.screen_height
+
+    @property
+    def previewer_center(self):
+        return (self.screen_width / 2 - self.image_width / 2,
+                self.screen_height / 2 - self.image_height / 2)
+
     def generate_calibration_directions(self):
         num_points = len(self.calibration_points)
         # Generate lists for directions
@@ -159,6 +207,11 @@ class Graphics:
                 center=(self.screen_width // 2, start_y + i * (text_surface.get_height() + 10)))
             screen.blit(text_surface, text_rect)
 
+    def _flip(self, screen):
+        pygame.display.flip()
+        if self.frame_callback is not None:
+            self.frame_callback(screen)
+
     def _new_session(self):
         self.running = True
         # self.current_point_index = 0  # Start at the first calibration point
@@ -176,29 +229,59 @@ class Graphics:
                 if space_continue:
                     self.running = False
 
-    def draw_previewer(self, screen):
+    def draw_previewer(self, screen, face_quality_pipeline: 'FaceQualityPipeline' = None,
+                       recorder: PreviewRecorder = None):
+        """
+        Shows the camera preview until "Space" is pressed.
+
+        :param screen: pygame screen
+        :param face_quality_pipeline: optional pipeline used to overlay face positioning feedback
+        :param recorder: optional started recorder that receives every preview frame
+        """
         self._new_session()
         self.et_library.start_previewing()
+        if face_quality_pipeline is not None:
+            face_quality_pipeline.reset()
 
         while self.running:
             self.check_keys()
             screen.fill(self._color_white)
             image = self.et_library.get_previewer_image()
+            if recorder is not None:
+                recorder.write(image)
+            face_quality = face_quality_pipeline.process(image) if face_quality_pipeline is not None else None
             image = cv2.rotate(image, cv2.ROTATE_90_COUNTERCLOCKWISE)
             image = cv2.flip(image, 0)
             pygame.surfarray.blit_array(self.previewer_surface, image)
             screen.blit(self.previewer_surface, self.previewer_center)
-            pygame.display.flip()
+            if face_quality is not None:
+                self.draw_face_quality(screen, face_quality)
+            self._flip(screen)
 
         self.et_library.stop_previewing()
 
+    def draw_face_quality(self, screen, face_quality: 'FaceQuality'):
+        """Draws the face box over the previewer and the head distance and eye openness below it."""
+        if face_quality.status == 1:
+            x, y, w, h = face_quality.face_box
+            face_rect = pygame.Rect(self.previewer_center[0] + x, self.previewer_center[1] + y, w, h)
+            pygame.draw.rect(screen, self._color_green, face_rect.clip(screen.get_rect()), width=3)
+            text = (f"Distance: {face_quality.head_distance:.1f} cm    "
+                    f"Eye openness: {face_quality.left_openness:.2f} / {face_quality.right_openness:.2f}")
+        else:
+            text = "No face detected"
+        text_surface = self.guidance_font.render(text, True, self._color_black)
+        text_rect = text_surface.get_rect(center=(self.screen_width // 2,
+                                                  self.previewer_center[1] + self.image_height + 30))
+        screen.blit(text_surface, text_rect)
+
     def draw_calibration(self, screen):
         self.running = True
         while self.running:
             self.check_keys()
             screen.fill(self._color_white)
             self.draw_guidance_text(screen)
-            pygame.display.flip()
+            self._flip(screen)
 
         self.et_library.start_calibration()
         self.running = True
@@ -211,14 +294,22 @@ class Graphics:
                 self._last_drawing_point = calibration_point
 
             self.draw_points(screen, calibration_point.x, calibration_point.y, calibration_point.progress)
-            pygame.display.flip()
+            self._flip(screen)
 
             if self.et_library.is_calibration_finished():
                 # self.et_library.get_calibration_result()
                 self.running = False
         # print("calibration information:", self.et_library.export_calibration())
 
-    def draw_sampling(self, screen):
+    def draw_sampling(self, screen, clock_aligner: ClockAligner = None, gaze_predictor: GazePredictor = None):
+        """
+        Shows the calibration result and the live gaze cursor until "Space" is pressed.
+
+        :param screen: pygame screen
+        :param clock_aligner: optional aligner that is updated with every gaze sample
+        :param gaze_predictor: optional predictor used to draw the cursor at the expected presentation time,
+            its `screen_size` is set to this screen
+        """
         cali_result: CalibrationResult = self.et_library.get_calibration_result()
         render_text_list = []
         if cali_result.status == 1:
@@ -231,20 +322,81 @@ class Graphics:
             render_text_list.append(f"模型误差为 {cali_result.fitting_error} ")
 
         print(render_text_list)
+        if gaze_predictor is not None:
+            gaze_predictor.screen_size = self.screen_geometry.screen_size
         self.running = True
         while self.running:
             self.check_keys(space_continue=True)
             screen.fill(self._color_white)
             self.draw_text_center(screen, render_text_list)
             if cali_result.status == 1:
-                gaze_info: GazeInfo = self.et_library.get_gaze_info()
+                if clock_aligner is not None:
+                    gaze_info: GazeInfo = clock_aligner.sample(self.et_library)
+                else:
+                    gaze_info: GazeInfo = self.et_library.get_gaze_info()
                 # print(gaze_info)
+                if gaze_predictor is not None:
+                    if clock_aligner is not None and clock_aligner.count >= 2:
+                        gaze_predictor.update(gaze_info, float(clock_aligner.to_host(gaze_info.timestamp)))
+                    else:
+                        gaze_predictor.update(gaze_info)
+                    predicted = gaze_predictor.predict_next_frame()
+                    if predicted is not None:
+                        gaze_info = GazeInfo(status=gaze_info.status, timestamp=gaze_info.timestamp,
+                                             gaze_x=predicted[0], gaze_y=predicted[1],
+                                             left_openness=gaze_info.left_openness,
+                                             right_openness=gaze_info.right_openness)
                 self.draw_gaze_cursor(screen, gaze_info)
 
-            pygame.display.flip()
+            self._flip(screen)
+            if gaze_predictor is not None:
+                gaze_predictor.frame_presented()
         if cali_result.status == 1:
             self.et_library.stop_sampling()
 
+    def draw_drift_check(self, screen, points=((0.5, 0.5),), model='affine', settle_time=0.5, sample_time=1.0):
+        """
+        Shows a short one- to five-point check and fits a drift correction from it.
+
+        Sampling must already be running (`start_sampling`).
+
+        :param screen: pygame screen
+        :param points: check points in normalized screen coordinates (0-1)
+        :param model: correction model passed to DriftCorrection
+        :param settle_time: seconds to wait on each point before collecting samples
+        :param sample_time: seconds of samples collected on each point
+        :return: the fitted DriftCorrection, or None if the check was aborted
+        """
+        targets, measured = [], []
+        self.running = True
+        for x, y in points:
+            target = (int(x * self.screen_width), int(y * self.screen_height))
+            samples = []
+            self.feedback_sound.play()
+            start = time.perf_counter()
+            while self.running:
+                self.check_keys(space_continue=False)
+                elapsed = time.perf_counter() - start
+                if elapsed > settle_time + sample_time:
+                    break
+                screen.fill(self._color_white)
+                self.draw_points(screen, target[0], target[1], 100 * elapsed / (settle_time + sample_time))
+                self._flip(screen)
+                if elapsed > settle_time:
+                    gaze_info: GazeInfo = self.et_library.get_gaze_info()
+                    if gaze_info.status == 1:
+                        samples.append((gaze_info.gaze_x, gaze_info.gaze_y))
+            if not self.running:
+                return None
+            if samples:
+                targets.append(target)
+                measured.append(np.median(samples, axis=0))
+
+        if not targets:
+            return None
+        return DriftCorrection(model=model, screen_size=(self.screen_width, self.screen_height)).fit(targets,
+                                                                                                     measured)
+
     # def draw_validation(self, screen):
     # self.draw(screen, "validation")
 
@@ -278,7 +430,7 @@ class Graphics:
                     return True
             screen.fill(self._color_white)
             self.draw_text_center(screen, render_text)
-            pygame.display.flip()
+            self._flip(screen)
 
     def validation_sample_subscriber(self, face_info, gaze_info, *args, **kwargs):
         """
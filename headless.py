@@ -0,0 +1,279 @@
+# _*_ coding: utf-8 _*_
+# Author: GC Zhu
+# Email: zhugc2016@gmail.com
+
+"""
+Headless rendering for Graphics: offscreen screens, frame capture and a render-throughput benchmark.
+
+Usage:
+    python headless.py --frames 300
+"""
+
+import argparse
+import math
+import os
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pygame
+
+from core import CalibrationPoint, CalibrationResult, GazeInfo
+from face_quality import FaceQuality
+from graphics import Graphics
+from screen_geometry import ScreenGeometry
+
+
+def init_headless(screen_size=(1920, 1080)):
+    """
+    Initializes pygame without a window or audio device.
+
+    Must be called before any other pygame initialization in the process.
+
+    :param screen_size: size of the offscreen screen in pixels
+    :return: the offscreen screen surface
+    """
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+    os.environ['SDL_AUDIODRIVER'] = 'dummy'
+    pygame.display.init()
+    pygame.font.init()
+    return pygame.display.set_mode(screen_size)
+
+
+class FrameCapture:
+    """
+    Copies rendered frames into a preallocated (n_frames, height, width) buffer of raw pixels.
+
+    The rows of a 32-bit surface are copied as they are laid out in memory, which is a
+    plain contiguous copy, and converted to (height, width, 3) RGB only when a frame is
+    read back with `frame` or `last_frame`. Use it as `Graphics.frame_callback`; when the
+    buffer is full, the oldest frames are overwritten.
+    """
+
+    def __init__(self, n_frames, screen_size=(1920, 1080)):
+        """
+        :param n_frames: number of frames kept
+        :param screen_size: (width, height) of the captured screen
+        """
+        width, height = screen_size
+        self.frames = np.zeros((n_frames, height, width), dtype=np.uint32)
+        self.count = 0
+        self._channels = None  # byte offsets of R, G and B within a pixel
+
+    def __call__(self, screen):
+        self.capture(screen)
+
+    def capture(self, screen):
+        if self._channels is None:
+            if screen.get_bytesize() != 4:
+                raise ValueError("FrameCapture needs a 32-bit screen surface.")
+            shifts = screen.get_shifts()[:3]
+            self._channels = [shift // 8 if sys.byteorder == 'little' else 3 - shift // 8 for shift in shifts]
+        pixels = pygame.surfarray.pixels2d(screen)
+        np.copyto(self.frames[self.count % len(self.frames)], pixels.T)
+        del pixels  # unlock the surface
+        self.count += 1
+
+    def frame(self, index):
+        """
+        :param index: index of a captured frame, negative counts from the latest one
+        :return: (height, width, 3) uint8 RGB image
+        """
+        if index < 0:
+            index += self.count
+        if not max(self.count - len(self.frames), 0) <= index < self.count:
+            raise IndexError(f"Frame {index} is not in the buffer.")
+        raw = self.frames[index % len(self.frames)]
+        return raw.view(np.uint8).reshape(raw.shape + (4,))[..., self._channels]
+
+    def last_frame(self):
+        return self.frame(-1) if self.count else None
+
+
+class SyntheticTracker:
+    """
+    Replaces TCCIDesktopET for soak tests and benchmarks of the full-screen routines.
+
+    It serves the bundled face image as preview, walks through `cali_mode` calibration
+    points (one per `frames_per_point` queries) and returns gaze moving on a circle.
+    """
+
+    def __init__(self, screen_geometry: ScreenGeometry = None, cali_mode=9, frames_per_point=10):
+        self.screen_geometry = ScreenGeometry() if screen_geometry is None else screen_geometry
+        self.image_width = 640
+        self.image_height = 480
+        _image_path = Path(__file__).parent.absolute() / 'res/image/face.jpg'
+        image = cv2.cvtColor(cv2.imread(str(_image_path)), cv2.COLOR_BGR2RGB)
+        self.image = cv2.resize(image, (self.image_width, self.image_height))
+        self.cali_mode = cali_mode
+        self.frames_per_point = frames_per_point
+        self._calibration_queries = 0
+        self._gaze_queries = 0
+
+    @property
+    def screen_width(self):
+        return self.screen_geometry.screen_width
+
+    @property
+    def screen_height(self):
+        return self.screen_geometry.screen_height
+
+    def start_previewing(self):
+        return 0
+
+    def stop_previewing(self):
+        return 0
+
+    def get_previewer_image(self):
+        return self.image
+
+    def start_calibration(self):
+        self._calibration_queries = 0
+        return 0
+
+    def get_calibration_point_info(self) -> CalibrationPoint:
+        index = min(self._calibration_queries // self.frames_per_point, self.cali_mode - 1)
+        progress = self._calibration_queries % self.frames_per_point * 100 // self.frames_per_point
+        self._calibration_queries += 1
+        columns = math.ceil(math.sqrt(self.cali_mode))
+        x = (0.1 + 0.8 * (index % columns) / max(columns - 1, 1)) * self.screen_width
+        y = (0.1 + 0.8 * (index // columns) / max(columns - 1, 1)) * self.screen_height
+        return CalibrationPoint(x=x, y=y, progress=progress)
+
+    def is_calibration_finished(self):
+        return self._calibration_queries >= self.cali_mode * self.frames_per_point
+
+    def get_calibration_result(self) -> CalibrationResult:
+        return CalibrationResult(status=1, fitting_error=0, sample_size=self.cali_mode)
+
+    def start_sampling(self):
+        return 0
+
+    def stop_sampling(self):
+        return 0
+
+    def get_gaze_info(self) -> GazeInfo:
+        self._gaze_queries += 1
+        angle = self._gaze_queries / 30
+        return GazeInfo(status=1,
+                        timestamp=self._gaze_queries,
+                        gaze_x=self.screen_width / 2 + self.screen_height / 3 * math.cos(angle),
+                        gaze_y=self.screen_height / 2 + self.screen_height / 3 * math.sin(angle),
+                        left_openness=1.0,
+                        right_openness=1.0)
+
+
+def _primitive_routines(graphics: Graphics):
+    """Per-frame draw_* routines with representative arguments."""
+    center = (graphics.screen_width // 2, graphics.screen_height // 2)
+    gaze_info = GazeInfo(status=1, gaze_x=center[0] + 100, gaze_y=center[1] + 50)
+    face_quality = FaceQuality(status=1, face_box=(180, 100, 280, 300), head_distance=60.0,
+                               left_openness=0.3, right_openness=0.3)
+    return {
+        'draw_breathing_effect': lambda screen, i: graphics.draw_breathing_effect(
+            screen, center, 60, 20, (i % 100) / 25),
+        'draw_arrows': lambda screen, i: graphics.draw_arrows(screen, center, 'left' if i % 2 else 'right'),
+        'draw_guidance_text': lambda screen, i: graphics.draw_guidance_text(screen),
+        'draw_text_center': lambda screen, i: graphics.draw_text_center(screen, ["line one", "line two"]),
+        'draw_gaze_cursor': lambda screen, i: graphics.draw_gaze_cursor(screen, gaze_info),
+        'draw_points': lambda screen, i: graphics.draw_points(screen, center[0], center[1], i % 100),
+        'draw_error_bar': lambda screen, i: graphics.draw_error_bar(
+            screen, center, (gaze_info.gaze_x, gaze_info.gaze_y)),
+        'draw_face_quality': lambda screen, i: graphics.draw_face_quality(screen, face_quality),
+    }
+
+
+def benchmark_primitives(graphics: Graphics, screen, n_frames=300):
+    """
+    Renders every per-frame draw_* routine as fast as possible.
+
+    :return: dict of routine name -> frames per second (including fill and flip)
+    """
+    results = {}
+    for name, routine in _primitive_routines(graphics).items():
+        start = time.perf_counter()
+        for i in range(n_frames):
+            screen.fill(graphics._color_white)
+            routine(screen, i)
+            graphics._flip(screen)
+        results[name] = n_frames / (time.perf_counter() - start)
+    return results
+
+
+def benchmark_screens(graphics: Graphics, screen, n_frames=300):
+    """
+    Runs the full-screen routines against a SyntheticTracker as fast as possible.
+
+    Every routine is ended after `n_frames` frames by posting the key it waits for; the
+    drift check, which only ends on its own timer, samples gaze on every frame and is
+    stopped by clearing `Graphics.running`.
+
+    :return: dict of routine name -> frames per second
+    """
+    frames = [0]
+    user_callback = graphics.frame_callback
+
+    def post_key(key):
+        return lambda: pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=key))
+
+    def stop_running():
+        graphics.running = False
+
+    screens = {
+        'draw_previewer': (lambda: graphics.draw_previewer(screen), post_key(pygame.K_SPACE)),
+        'draw_calibration': (lambda: graphics.draw_calibration(screen), post_key(pygame.K_SPACE)),
+        'draw_sampling': (lambda: graphics.draw_sampling(screen), post_key(pygame.K_SPACE)),
+        'draw_drift_check': (lambda: graphics.draw_drift_check(screen, settle_time=0, sample_time=math.inf),
+                             stop_running),
+        'draw_calibration_result': (lambda: graphics.draw_calibration_result(screen, 0.0, True),
+                                    post_key(pygame.K_RETURN)),
+    }
+    results = {}
+    stop = [None]
+
+    def end_after_n_frames(surface):
+        if user_callback is not None:
+            user_callback(surface)
+        frames[0] += 1
+        if frames[0] % n_frames == 0:
+            stop[0]()
+
+    graphics.frame_callback = end_after_n_frames
+    try:
+        for name, (routine, stop[0]) in screens.items():
+            pygame.event.clear()
+            frames[0] = 0
+            start = time.perf_counter()
+            routine()
+            results[name] = frames[0] / (time.perf_counter() - start)
+    finally:
+        graphics.frame_callback = user_callback
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless render-throughput benchmark of Graphics.")
+    parser.add_argument('--frames', type=int, default=300, help="frames rendered per routine")
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--capture', action='store_true', help="also copy every frame into a numpy buffer")
+    args = parser.parse_args(argv)
+
+    screen_size = (args.width, args.height)
+    screen = init_headless(screen_size)
+    tracker = SyntheticTracker(ScreenGeometry(screen_size=screen_size))
+    graphics = Graphics(et_library=tracker, headless=True)
+    if args.capture:
+        graphics.frame_callback = FrameCapture(8, screen_size)
+
+    results = benchmark_primitives(graphics, screen, args.frames)
+    results.update(benchmark_screens(graphics, screen, args.frames))
+    for name, fps in results.items():
+        print(f"{name:<24}{fps:10.1f} frames/s")
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    main()
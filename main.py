@@ -6,6 +6,7 @@ import pygame
 from pygame import FULLSCREEN, HWSURFACE
 
 from core import TCCIDesktopET
+from face_quality import create_pipeline
 from graphics import Graphics
 
 # initialize TCCIDesktopET
@@ -13,7 +14,7 @@ et_library = TCCIDesktopET()
 print("Eye tracker library version:", et_library.get_version())
 et_library.eye_tracking_init(cam_id=0, look_ahead=2, preprocessing_type=1)
 et_library.set_cali_mode(9)
-et_library.set_tracing_region(200, 200, 1920 - 400, 1080 - 400)
+et_library.set_tracing_region(200, 200, et_library.screen_width - 400, et_library.screen_height - 400)
 
 print("Starting eye tracking registration process...")
 expired_days = et_library.eye_tracking_register("c8f076bc10dd43d6")
@@ -26,11 +27,11 @@ else:
 # initialize PyGame
 pygame.init()
 # scree size
-screen_size = (1920, 1080)
+screen_size = (et_library.screen_width, et_library.screen_height)
 # open a window in fullscreen mode
 screen = pygame.display.set_mode(screen_size, FULLSCREEN | HWSURFACE)
 
 g = Graphics(et_library=et_library)
-g.draw_previewer(screen=screen)
+g.draw_previewer(screen=screen, face_quality_pipeline=create_pipeline())
 g.draw_calibration(screen=screen)
 g.draw_sampling(screen=screen)
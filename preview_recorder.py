@@ -0,0 +1,208 @@
+# _*_ coding: utf-8 _*_
+# Author: GC Zhu
+# Email: zhugc2016@gmail.com
+
+import csv
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+
+
+class RecorderStats:
+    def __init__(self, recorded=0, dropped=0, queue_depth=0, max_queue_depth=0):
+        self.recorded = recorded
+        self.dropped = dropped
+        self.queue_depth = queue_depth
+        self.max_queue_depth = max_queue_depth
+
+    def __str__(self):
+        return str({
+            'recorded': self.recorded,
+            'dropped': self.dropped,
+            'queue_depth': self.queue_depth,
+            'max_queue_depth': self.max_queue_depth
+        })
+
+
+class PreviewRecorder:
+    """
+    Records previewer frames to a video file without blocking the render loop.
+
+    `write` copies the shared `TCCIDesktopET.image` buffer into a buffer taken from a
+    preallocated pool and hands it to an encoder thread through a bounded queue. When
+    the queue is full, either the oldest queued frame or the incoming frame is dropped,
+    depending on `drop_policy`. For every encoded frame, the frame index, host timestamp
+    and latest native gaze timestamp are written to a sidecar csv, so video frames can be
+    aligned to gaze samples.
+
+    Example:
+        recorder = PreviewRecorder("face.mp4", fps=30)
+        recorder.start()
+        while running:
+            image = et_library.get_previewer_image()
+            recorder.write(image)
+        recorder.stop()
+    """
+
+    def __init__(self, path, fps=30.0, frame_size=(640, 480), queue_size=64, drop_policy=DROP_OLDEST,
+                 fourcc='mp4v', index_path=None):
+        """
+        :param path: video file path
+        :param fps: nominal frame rate written to the video header
+        :param frame_size: (width, height) of the frames
+        :param queue_size: maximum number of frames waiting to be encoded
+        :param drop_policy: DROP_OLDEST or DROP_NEWEST, what to drop when the queue is full
+        :param fourcc: codec of `cv2.VideoWriter`
+        :param index_path: sidecar csv path, defaults to the video path with a `.csv` suffix
+        """
+        if drop_policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"Invalid drop policy: {drop_policy}, you need to choose from "
+                             f"{DROP_OLDEST} and {DROP_NEWEST}.")
+        self.path = str(path)
+        self.index_path = str(index_path) if index_path is not None else self.path.rsplit('.', 1)[0] + '.csv'
+        self.fps = fps
+        self.frame_size = tuple(frame_size)
+        self.queue_size = queue_size
+        self.drop_policy = drop_policy
+        self.fourcc = fourcc
+
+        # one buffer per queue slot plus the one being encoded
+        width, height = self.frame_size
+        self._free = [np.empty((height, width, 3), dtype=np.uint8) for _ in range(queue_size + 1)]
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+        self._error = None  # exception raised by the encoder thread
+
+        self._frame_index = 0
+        self._recorded = 0
+        self._dropped = 0
+        self._max_queue_depth = 0
+
+    def start(self):
+        """
+        Starts a new recording; restarting after `stop` overwrites the files and resets the counters.
+
+        :raises OSError: if the video or the sidecar csv cannot be opened
+        """
+        if self._running:
+            return
+        writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*self.fourcc), self.fps, self.frame_size)
+        if not writer.isOpened():
+            raise OSError(f"Could not open {self.path} for writing with fourcc {self.fourcc!r}.")
+        try:
+            index_file = open(self.index_path, 'w', newline='')
+        except OSError:
+            writer.release()
+            raise
+        self._frame_index = 0
+        self._recorded = 0
+        self._dropped = 0
+        self._max_queue_depth = 0
+        self._error = None
+        self._running = True
+        self._thread = threading.Thread(target=self._encode_loop, args=(writer, index_file), name='PreviewRecorder',
+                                        daemon=True)
+        self._thread.start()
+
+    def write(self, image: np.ndarray, timestamp: float = None, gaze_timestamp: int = -1) -> bool:
+        """
+        Queues a copy of the frame for encoding.
+
+        :param image: (height, width, 3) uint8 RGB frame, e.g. from `get_previewer_image`
+        :param timestamp: host timestamp of the frame, defaults to `time.perf_counter()`
+        :param gaze_timestamp: native timestamp of the latest `GazeInfo`, -1 if not sampling
+        :return: True if the frame was queued, False if it was dropped
+        :raises: the exception that stopped the encoder thread, if any
+        """
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        with self._condition:
+            if self._error is not None:
+                raise self._error
+            frame_index = self._frame_index
+            self._frame_index += 1
+            if len(self._queue) >= self.queue_size:
+                if self.drop_policy == DROP_NEWEST:
+                    self._dropped += 1
+                    return False
+                buffer = self._queue.popleft()[-1]
+                self._dropped += 1
+            else:
+                buffer = self._free.pop()
+            np.copyto(buffer, image)
+            self._queue.append((frame_index, timestamp, gaze_timestamp, buffer))
+            self._max_queue_depth = max(self._max_queue_depth, len(self._queue))
+            self._condition.notify()
+        return True
+
+    def stop(self):
+        """
+        Encodes the remaining queued frames and closes the files.
+
+        :raises: the exception that stopped the encoder thread, if any
+        """
+        if not self._running:
+            return
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        self._thread.join()
+        self._thread = None
+        error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    def get_stats(self) -> RecorderStats:
+        with self._condition:
+            return RecorderStats(recorded=self._recorded,
+                                 dropped=self._dropped,
+                                 queue_depth=len(self._queue),
+                                 max_queue_depth=self._max_queue_depth)
+
+    def _encode_loop(self, writer, index_file):
+        try:
+            index_writer = csv.writer(index_file)
+            index_writer.writerow(['video_frame', 'frame_index', 'host_timestamp', 'gaze_timestamp'])
+            while True:
+                with self._condition:
+                    while self._running and not self._queue:
+                        self._condition.wait()
+                    if not self._queue:
+                        break
+                    frame_index, timestamp, gaze_timestamp, buffer = self._queue.popleft()
+
+                # encode and write outside the lock, so `write` never waits for the disk
+                try:
+                    writer.write(cv2.cvtColor(buffer, cv2.COLOR_RGB2BGR))
+                    index_writer.writerow([self._recorded, frame_index, repr(timestamp), gaze_timestamp])
+                finally:
+                    with self._condition:
+                        self._free.append(buffer)
+
+                with self._condition:
+                    self._recorded += 1
+        except Exception as e:
+            with self._condition:
+                self._error = e
+                # the frames still queued are never written
+                self._dropped += len(self._queue)
+                self._free.extend(item[-1] for item in self._queue)
+                self._queue.clear()
+        finally:
+            writer.release()
+            index_file.close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
@@ -0,0 +1,246 @@
+# _*_ coding: utf-8 _*_
+# Author: GC Zhu
+# Email: zhugc2016@gmail.com
+
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import pygame
+
+from core import TCCIDesktopET
+from graphics import Graphics
+
+
+# Graphics routines that run a whole session loop; timing them as one call hides the frames inside
+SESSION_METHOD_NAMES = ('draw_previewer', 'draw_calibration', 'draw_sampling', 'draw_drift_check',
+                        'draw_calibration_result')
+
+
+class CallStats:
+    def __init__(self, count=0, total_time=0.0, self_time=0.0, max_time=0.0):
+        """
+        :param count: number of calls
+        :param total_time: inclusive time in seconds, including nested instrumented calls
+        :param self_time: exclusive time in seconds, without nested instrumented calls
+        :param max_time: longest inclusive call in seconds
+        """
+        self.count = count
+        self.total_time = total_time
+        self.self_time = self_time
+        self.max_time = max_time
+
+    @property
+    def mean_time(self):
+        return self.total_time / self.count if self.count else 0.0
+
+    def __str__(self):
+        return str({
+            'count': self.count,
+            'total_time': self.total_time,
+            'self_time': self.self_time,
+            'mean_time': self.mean_time,
+            'max_time': self.max_time
+        })
+
+
+class Profiler:
+    """
+    Per-call counters, timers and traces for TCCIDesktopET and Graphics.
+
+    Targets registered with `instrument` are only wrapped while the profiler is enabled:
+    `enable` shadows the methods with timing wrappers on the instances and `disable`
+    removes them again, so a disabled profiler adds no cost to any call. The most
+    recent `capacity` calls are kept in a ring buffer together with the frame index at
+    call start (incremented on every `pygame.display.flip`) and their exclusive time, so
+    nested calls are not counted twice per frame. They can be written as Chrome
+    trace-event JSON, viewable in chrome://tracing or https://ui.perfetto.dev.
+
+    The session loops in `SESSION_METHOD_NAMES` are not instrumented by default, only
+    the routines they call every frame. Work they do themselves (e.g. `screen.fill`) is
+    not in the instrumented time, but it is in the flip-to-flip wall time of `frame_times`.
+
+    Example:
+        profiler = Profiler()
+        profiler.instrument(et_library)
+        profiler.instrument(g)
+        profiler.enable()
+        g.draw_sampling(screen)
+        profiler.disable()
+        profiler.dump_chrome_trace("trace.json")
+    """
+
+    def __init__(self, capacity=100000):
+        """
+        :param capacity: number of calls kept in the trace ring buffer
+        """
+        self.enabled = False
+        self.frame_index = 0
+        self.stats = {}
+        self._events = deque(maxlen=capacity)
+        self._flips = deque(maxlen=capacity)  # (frame_index, host time at the end of the flip)
+        self._targets = []
+        self._lock = threading.Lock()
+        # per-thread stack of the nested-call time of the calls in progress
+        self._local = threading.local()
+        self._origin = time.perf_counter()
+        self._original_flip = None
+
+    @staticmethod
+    def default_method_names(target):
+        """Every public TCCIDesktopET method and every per-frame `draw_*` method of Graphics."""
+        if isinstance(target, TCCIDesktopET):
+            return [name for name, value in vars(TCCIDesktopET).items()
+                    if callable(value) and not name.startswith('_')]
+        if isinstance(target, Graphics):
+            return [name for name, value in vars(Graphics).items()
+                    if callable(value) and name.startswith('draw_') and name not in SESSION_METHOD_NAMES]
+        raise TypeError(f"No default methods for {type(target).__name__}, please pass method names.")
+
+    def instrument(self, target, method_names=None, prefix=None):
+        """
+        Registers methods of an instance to be timed while the profiler is enabled.
+
+        :param target: TCCIDesktopET, Graphics or any other instance
+        :param method_names: methods to time, defaults to `default_method_names(target)`
+        :param prefix: name prefix in the statistics and traces, defaults to the class name
+        """
+        if method_names is None:
+            method_names = self.default_method_names(target)
+        prefix = type(target).__name__ if prefix is None else prefix
+        self._targets.append((target, list(method_names), prefix))
+        if self.enabled:
+            self._wrap(target, method_names, prefix)
+
+    def enable(self):
+        if self.enabled:
+            return
+        self.enabled = True
+        with self._lock:
+            # the first frame after enabling has no flip to measure its wall time from
+            self._flips.append((self.frame_index - 1, None))
+        for target, method_names, prefix in self._targets:
+            self._wrap(target, method_names, prefix)
+        self._original_flip = pygame.display.flip
+        pygame.display.flip = self._flip
+
+    def disable(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        for target, method_names, _ in self._targets:
+            for name in method_names:
+                target.__dict__.pop(name, None)
+        pygame.display.flip = self._original_flip
+        self._original_flip = None
+
+    def reset(self):
+        with self._lock:
+            self.stats = {}
+            self._events.clear()
+            self._flips.clear()
+            self.frame_index = 0
+
+    def _wrap(self, target, method_names, prefix):
+        for name in method_names:
+            method = getattr(target, name)
+            setattr(target, name, self._timed(method, f'{prefix}.{name}'))
+
+    def _timed(self, function, name):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            return self._call(name, function, args, kwargs)
+
+        return wrapper
+
+    def _flip(self, *args, **kwargs):
+        try:
+            return self._call('pygame.display.flip', self._original_flip, args, kwargs)
+        finally:
+            with self._lock:
+                self._flips.append((self.frame_index, time.perf_counter()))
+                self.frame_index += 1
+
+    def _call(self, name, function, args, kwargs):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        frame = self.frame_index
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            duration = time.perf_counter() - start
+            nested = stack.pop()
+            if stack:
+                stack[-1] += duration
+            self._record(name, start, duration, duration - nested, frame)
+
+    def _record(self, name, start, duration, self_time, frame):
+        with self._lock:
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = self.stats[name] = CallStats()
+            stats.count += 1
+            stats.total_time += duration
+            stats.self_time += self_time
+            stats.max_time = max(stats.max_time, duration)
+            self._events.append((name, start, duration, self_time, threading.get_ident(), frame))
+
+    def get_stats(self):
+        """
+        :return: dict of call name -> CallStats, sorted by total time
+        """
+        with self._lock:
+            return dict(sorted(self.stats.items(), key=lambda item: item[1].total_time, reverse=True))
+
+    def frame_times(self):
+        """
+        Per-frame timings of the buffered frames.
+
+        The instrumented time is the exclusive time of the instrumented calls started in
+        the frame. The wall time runs from the end of the previous flip to the end of the
+        frame's own flip and also covers uninstrumented work; it is None for the first
+        frame after `enable` or `reset` and for a frame that is not flipped yet.
+
+        :return: list of (frame_index, instrumented seconds, wall seconds or None)
+        """
+        instrumented = {}
+        with self._lock:
+            events = list(self._events)
+            flips = list(self._flips)
+        for name, start, duration, self_time, _, frame in events:
+            instrumented[frame] = instrumented.get(frame, 0.0) + self_time
+        wall = {frame: end - previous_end
+                for (previous_frame, previous_end), (frame, end) in zip(flips, flips[1:])
+                if previous_end is not None and frame == previous_frame + 1}
+        frames = sorted(set(instrumented) | set(wall))
+        return [(frame, instrumented.get(frame, 0.0), wall.get(frame)) for frame in frames]
+
+    def dump_chrome_trace(self, path):
+        """
+        Writes the buffered calls in Chrome trace-event JSON.
+
+        :param path: output json path
+        """
+        with self._lock:
+            events = list(self._events)
+        pid = os.getpid()
+        trace_events = [{
+            'name': name,
+            'ph': 'X',
+            'ts': (start - self._origin) * 1e6,
+            'dur': duration * 1e6,
+            'pid': pid,
+            'tid': tid,
+            'args': {'frame': frame, 'self_us': self_time * 1e6}
+        } for name, start, duration, self_time, tid, frame in events]
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, f)
+
+    def __str__(self):
+        return '\n'.join(f'{name}: {stats}' for name, stats in self.get_stats().items())
@@ -0,0 +1,140 @@
+# _*_ coding: utf-8 _*_
+# Author: GC Zhu
+# Email: zhugc2016@gmail.com
+
+import numpy as np
+
+
+class ScreenGeometry:
+    """
+    Screen model shared by `TCCIDesktopET.set_cam_screen_info` and the analysis code.
+
+    Three coordinate systems are supported:
+        - pixels: origin at the top-left corner of the screen, y pointing down
+        - centimeters: origin at the camera, same axes as pixels
+        - visual degrees: angle from the gaze origin (default: screen center) for a viewing distance
+
+    The pixel/centimeter affine transforms are built once as 3x3 matrices, so batch
+    conversions are a single matrix product over (n, 2) arrays.
+    """
+
+    def __init__(self, camera_position=(17.09, -0.65), screen_size=(1920, 1080), screen_size_cm=(34.4, 19.4)):
+        """
+        :param camera_position: camera position in centimeters relative to the top-left screen corner
+        :param screen_size: screen resolution in pixels (width, height)
+        :param screen_size_cm: physical screen size in centimeters (width, height)
+        """
+        self.camera_position = tuple(float(v) for v in camera_position)
+        self.screen_size = tuple(int(v) for v in screen_size)
+        self.screen_size_cm = tuple(float(v) for v in screen_size_cm)
+
+        cm_per_px_x = self.screen_size_cm[0] / self.screen_size[0]
+        cm_per_px_y = self.screen_size_cm[1] / self.screen_size[1]
+        self._px_to_cm = np.array([[cm_per_px_x, 0, -self.camera_position[0]],
+                                   [0, cm_per_px_y, -self.camera_position[1]],
+                                   [0, 0, 1]], dtype=np.float64)
+        self._cm_to_px = np.linalg.inv(self._px_to_cm)
+
+    @property
+    def screen_width(self):
+        return self.screen_size[0]
+
+    @property
+    def screen_height(self):
+        return self.screen_size[1]
+
+    @property
+    def screen_size_inch(self):
+        return self.screen_size_cm[0] / 2.54, self.screen_size_cm[1] / 2.54
+
+    @property
+    def dpi(self):
+        """Screen dpi (dpi_x, dpi_y), as passed to the native `set_camera_screen_info`."""
+        return self.screen_size[0] / self.screen_size_inch[0], self.screen_size[1] / self.screen_size_inch[1]
+
+    @property
+    def px_to_cm_matrix(self):
+        return self._px_to_cm
+
+    @property
+    def cm_to_px_matrix(self):
+        return self._cm_to_px
+
+    @property
+    def screen_center_cm(self):
+        return self._apply(self._px_to_cm, np.array([self.screen_size[0] / 2, self.screen_size[1] / 2]))
+
+    @staticmethod
+    def _apply(matrix, points):
+        points = np.asarray(points, dtype=np.float64)
+        return points @ matrix[:2, :2].T + matrix[:2, 2]
+
+    def px_to_cm(self, points):
+        """
+        Converts pixels to centimeters relative to the camera.
+
+        :param points: (..., 2) array of (x, y) pixels
+        :return: (..., 2) array of (x, y) centimeters
+        """
+        return self._apply(self._px_to_cm, points)
+
+    def cm_to_px(self, points):
+        """
+        Converts centimeters relative to the camera to pixels.
+
+        :param points: (..., 2) array of (x, y) centimeters
+        :return: (..., 2) array of (x, y) pixels
+        """
+        return self._apply(self._cm_to_px, points)
+
+    def cm_to_deg(self, points, viewing_distance, origin=None):
+        """
+        Converts centimeters relative to the camera to visual degrees.
+
+        :param points: (..., 2) array of (x, y) centimeters
+        :param viewing_distance: eye-to-screen distance in centimeters, scalar or broadcastable to (...)
+        :param origin: (x, y) centimeters of the point straight in front of the eye, defaults to the screen center
+        :return: (..., 2) array of (horizontal, vertical) degrees
+        """
+        origin = self.screen_center_cm if origin is None else np.asarray(origin, dtype=np.float64)
+        offset = np.asarray(points, dtype=np.float64) - origin
+        distance = np.asarray(viewing_distance, dtype=np.float64)[..., None]
+        return np.degrees(np.arctan2(offset, distance))
+
+    def deg_to_cm(self, degrees, viewing_distance, origin=None):
+        """
+        Converts visual degrees to centimeters relative to the camera.
+
+        :param degrees: (..., 2) array of (horizontal, vertical) degrees
+        :param viewing_distance: eye-to-screen distance in centimeters, scalar or broadcastable to (...)
+        :param origin: (x, y) centimeters of the point straight in front of the eye, defaults to the screen center
+        :return: (..., 2) array of (x, y) centimeters
+        """
+        origin = self.screen_center_cm if origin is None else np.asarray(origin, dtype=np.float64)
+        distance = np.asarray(viewing_distance, dtype=np.float64)[..., None]
+        return origin + np.tan(np.radians(np.asarray(degrees, dtype=np.float64))) * distance
+
+    def px_to_deg(self, points, viewing_distance, origin=None):
+        """Converts pixels to visual degrees, see `cm_to_deg`."""
+        return self.cm_to_deg(self.px_to_cm(points), viewing_distance, origin)
+
+    def deg_to_px(self, degrees, viewing_distance, origin=None):
+        """Converts visual degrees to pixels, see `deg_to_cm`."""
+        return self.cm_to_px(self.deg_to_cm(degrees, viewing_distance, origin))
+
+    def pixels_per_degree(self, viewing_distance):
+        """
+        Pixels per degree around the screen center.
+
+        :param viewing_distance: eye-to-screen distance in centimeters
+        :return: (horizontal, vertical) pixels per degree
+        """
+        one_degree_cm = np.tan(np.radians(1.0)) * float(viewing_distance)
+        return one_degree_cm / self._px_to_cm[0, 0], one_degree_cm / self._px_to_cm[1, 1]
+
+    def __str__(self):
+        return str({
+            'camera_position': self.camera_position,
+            'screen_size': self.screen_size,
+            'screen_size_cm': self.screen_size_cm
+        })